@@ -818,17 +818,22 @@
 
 # Cell 1: Imports
 from langchain_google_genai import ChatGoogleGenerativeAI
-from decimal import Decimal, getcontext, InvalidOperation
+from decimal import Decimal, localcontext, InvalidOperation
 from pydantic import BaseModel, Field, ValidationError
 from typing import TypedDict, Optional, Dict, Any, List
 from dataclasses import dataclass, field, asdict
 from IPython.display import Image, display
 from requests.adapters import HTTPAdapter
-from langgraph.graph import StateGraph
+from langgraph.graph import StateGraph, END
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.types import interrupt, Command
 from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 from web3 import Web3
+from web3.exceptions import TransactionNotFound
+from eth_abi import decode
 import requests
+import asyncio
 import logging
 import json
 import time
@@ -838,6 +843,8 @@ import whisper
 import sounddevice as sd
 import numpy as np
 import pyttsx3
+import threading
+import queue
 import tempfile
 import scipy.io.wavfile as wav
 import re
@@ -855,6 +862,7 @@ def record_audio(duration=5, samplerate=16000):
 
 def whisper_transcribe(duration=5, model_name='base'):
     model = whisper.load_model(model_name)
+    speak_flush()  # don't record the agent's own voice
     audio_data = record_audio(duration)
     with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tempf:
         wav.write(tempf.name, 16000, (audio_data * 32767).astype(np.int16))
@@ -863,13 +871,38 @@ def whisper_transcribe(duration=5, model_name='base'):
     print(f"Whisper transcript: {text}")
     return text
 
-def speak_text(text):
-    clean_text = re.sub(r'[\\\*\`_\$\[\]\(\)]', '', str(text))  # strip markdown/math
+def _tts_engine():
+    """Initialise the pyttsx3 engine once and reuse it for every utterance"""
     engine = pyttsx3.init()
     engine.setProperty('rate', 180)
     engine.setProperty('volume', 1.0)
-    engine.say(clean_text)
-    engine.runAndWait()
+    return engine
+
+# Speech runs on its own thread so the (async) nodes never wait for playback
+_TTS_Q = queue.Queue()
+
+def _tts_worker():
+    # pyttsx3 engines must be driven from the thread that created them
+    engine = _tts_engine()
+    while True:
+        text = _TTS_Q.get()
+        try:
+            engine.say(text)
+            engine.runAndWait()
+        except Exception as e:
+            print(f"TTS failed: {e}")
+        finally:
+            _TTS_Q.task_done()
+
+threading.Thread(target=_tts_worker, daemon=True).start()
+
+def speak_text(text):
+    clean_text = re.sub(r'[\\\*\`_\$\[\]\(\)]', '', str(text))  # strip markdown/math
+    _TTS_Q.put(clean_text)
+
+def speak_flush():
+    """Block until everything queued with speak_text has been spoken"""
+    _TTS_Q.join()
 
 # Cell 2: Load Environment
 load_dotenv()
@@ -878,6 +911,10 @@ load_dotenv()
 with open("tokens_map.json") as f:
     TOKEN_MAP = json.load(f)
 
+# Checksum every address once so contract construction never has to redo it
+for _token in TOKEN_MAP.values():
+    _token["address"] = Web3.to_checksum_address(_token["address"])
+
 # Cell 4: Configuration
 # Determine if we're in testing mode (fork) or production (mainnet)
 IS_TESTING = os.getenv("IS_TESTING", "true").lower() == "true"
@@ -886,12 +923,10 @@ if IS_TESTING:
     # Tenderly Fork Configuration
     TENDERLY_RPC_URL = os.getenv('TENDERLY_RPC_URL')
     w3 = Web3(Web3.HTTPProvider(TENDERLY_RPC_URL))
-    print(f"✓ Connected to Tenderly Fork")
 else:
     # Mainnet Configuration
     ALCHEMY_RPC_URL = os.getenv("ALCHEMY_RPC_URL")
     w3 = Web3(Web3.HTTPProvider(ALCHEMY_RPC_URL))
-    print(f"✓ Connected to Mainnet")
 
 # Common Configuration
 COINGECKO_API_URL = os.getenv("COINGECKO_API_URL")
@@ -899,18 +934,53 @@ COINGECKO_API_KEY = os.getenv("COINGECKO_API_KEY")
 ONEINCH_API_KEY = os.getenv("ONEINCH_API_KEY")
 CHAIN_ID = int(os.getenv("CHAIN_ID", "1"))
 
+# Shared keep-alive session for CoinGecko, 1inch and JSON-RPC batch requests.
+# POST is retried so batch_rpc is covered. That is safe because nothing on this session
+# sends a transaction: eth_sendTransaction goes through the web3 provider (no retries),
+# and batch_rpc only carries reads plus idempotent tenderly_set* overrides.
+# 500 is left out, since the server may already have acted on that request.
+HTTP = requests.Session()
+_http_adapter = HTTPAdapter(
+    pool_connections=16,
+    pool_maxsize=32,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.2,
+        status_forcelist=[429, 502, 503, 504],
+        allowed_methods=["GET", "POST"],
+    ),
+)
+HTTP.mount("http://", _http_adapter)
+HTTP.mount("https://", _http_adapter)
+
 # 1inch URLs (only used in production)
 ONEINCH_BASE_URL = f"https://api.1inch.dev/swap/v6.0/{CHAIN_ID}"
 ONEINCH_QUOTE_URL = f"{ONEINCH_BASE_URL}/quote"
 ONEINCH_SWAP_URL = f"{ONEINCH_BASE_URL}/swap"
 
 # Uniswap Configuration (used in testing)
-UNISWAP_ROUTER = "0xE592427A0AEce92De3Edee1F18E0157C05861564"
+UNISWAP_ROUTER = Web3.to_checksum_address("0xE592427A0AEce92De3Edee1F18E0157C05861564")
+
+# Multicall3 is deployed at the same address on mainnet and on forks of it
+MULTICALL3_ADDRESS = Web3.to_checksum_address("0xcA11bde05977b3631167028862bE2a173976CA11")
 
-print(f"Connected: {w3.is_connected()}")
-print(f"Chain ID: {w3.eth.chain_id}")
-print(f"Latest Block: {w3.eth.block_number}")
-print(f"Mode: {'TESTING (Fork)' if IS_TESTING else 'PRODUCTION (Mainnet)'}")
+# Chain id never changes for a provider, so it is fetched at most once
+_CHAIN_ID: Optional[int] = None
+
+def get_chain_id() -> int:
+    """Chain id reported by the connected RPC (cached after the first call)"""
+    global _CHAIN_ID
+    if _CHAIN_ID is None:
+        _CHAIN_ID = w3.eth.chain_id
+    return _CHAIN_ID
+
+def log_startup():
+    """Log connection details (live RPC calls, so only done from run_agent, never at import)"""
+    logger.info("✓ Connected to %s", 'Tenderly Fork' if IS_TESTING else 'Mainnet')
+    logger.info("Connected: %s", w3.is_connected())
+    logger.info("Chain ID: %s", get_chain_id())
+    logger.info("Latest Block: %s", w3.eth.block_number)
+    logger.info("Mode: %s", 'TESTING (Fork)' if IS_TESTING else 'PRODUCTION (Mainnet)')
 
 # Cell 5: Whale Addresses for Testing
 WHALES = {
@@ -919,6 +989,7 @@ WHALES = {
     'DAI': '0x40ec5B33f54e0E8A33A975908C5BA1c14e5BbbDf',   # Polygon Bridge
     'WETH': '0x2F0b23f53734252Bda2277357e97e1517d6B042A',  # Gemini
 }
+WHALES = {sym: Web3.to_checksum_address(addr) for sym, addr in WHALES.items()}
 
 # Cell 6: ERC20 ABI
 ERC20_ABI = [
@@ -981,6 +1052,38 @@ UNISWAP_ROUTER_ABI = [{
     "type": "function"
 }]
 
+# Cell 7.5: Multicall3 ABI (aggregate3 + getEthBalance)
+MULTICALL3_ABI = [{
+    "inputs": [{
+        "components": [
+            {"internalType": "address", "name": "target", "type": "address"},
+            {"internalType": "bool", "name": "allowFailure", "type": "bool"},
+            {"internalType": "bytes", "name": "callData", "type": "bytes"}
+        ],
+        "internalType": "struct Multicall3.Call3[]",
+        "name": "calls",
+        "type": "tuple[]"
+    }],
+    "name": "aggregate3",
+    "outputs": [{
+        "components": [
+            {"internalType": "bool", "name": "success", "type": "bool"},
+            {"internalType": "bytes", "name": "returnData", "type": "bytes"}
+        ],
+        "internalType": "struct Multicall3.Result[]",
+        "name": "returnData",
+        "type": "tuple[]"
+    }],
+    "stateMutability": "payable",
+    "type": "function"
+}, {
+    "inputs": [{"internalType": "address", "name": "addr", "type": "address"}],
+    "name": "getEthBalance",
+    "outputs": [{"internalType": "uint256", "name": "balance", "type": "uint256"}],
+    "stateMutability": "view",
+    "type": "function"
+}]
+
 # Cell 8: Initialize LLM
 llm = ChatGoogleGenerativeAI(model="gemini-2.5-pro")
 
@@ -1027,13 +1130,26 @@ class Info(BaseModel):
     amount: float = Field(gt=0, description="Amount of asset_in to swap")
 
 # Cell 12: Helper Functions
-getcontext().prec = 60
+# 10**decimals for every decimals value a uint256 amount can use
+_POW10 = [10 ** i for i in range(78)]
+_POW10_DEC = [Decimal(p) for p in _POW10]
 
 def resolve_amount_to_base(amount: "float|str|Decimal", decimals: int) -> int:
-    """Convert human amount to integer base units using Decimal."""
+    """Convert human amount to integer base units (rounded down)."""
     if decimals < 0:
         raise ValueError("decimals must be non-negative")
-    
+
+    # Fast path: plain ints/floats/"123.456" strings are split and scaled with integer math
+    if isinstance(amount, (int, float, str)) and not isinstance(amount, bool) and decimals < len(_POW10):
+        text = repr(amount) if isinstance(amount, float) else str(amount).strip()
+        int_part, _, frac = text.partition(".")
+        if (int_part or frac) and (not int_part or int_part.isdigit()) and (not frac or frac.isdigit()):
+            if not (int_part + frac).strip("0"):
+                raise ValueError("amount must be > 0")
+            frac = frac.ljust(decimals, "0")[:decimals]
+            return int(int_part or 0) * _POW10[decimals] + int(frac or 0)
+
+    # Exponents, signs, Decimal inputs etc. go through Decimal for validation
     if isinstance(amount, Decimal):
         dec_amt = amount
     else:
@@ -1045,86 +1161,271 @@ def resolve_amount_to_base(amount: "float|str|Decimal", decimals: int) -> int:
     if dec_amt <= 0:
         raise ValueError("amount must be > 0")
 
-    scale = Decimal(10) ** Decimal(decimals)
-    base = (dec_amt * scale).to_integral_value(rounding="ROUND_DOWN")
+    with localcontext() as ctx:
+        ctx.prec = 60
+        scale = _POW10_DEC[decimals] if decimals < len(_POW10_DEC) else Decimal(10) ** decimals
+        base = (dec_amt * scale).to_integral_value(rounding="ROUND_DOWN")
     return int(base)
 
+# Decimals never change, so they are cached per token (prewarmed from TOKEN_MAP)
+_DECIMALS_CACHE: Dict[str, int] = {t["address"].lower(): t["decimals"] for t in TOKEN_MAP.values()}
+_CONTRACT_CACHE: Dict[tuple, Any] = {}
+
+def _get_contract(address: str, abi: List[Dict[str, Any]] = ERC20_ABI):
+    """Contract object for an address (ERC20 by default), bound once per (address, ABI) and reused"""
+    key = (address.lower(), id(abi))
+    contract = _CONTRACT_CACHE.get(key)
+    if contract is None:
+        contract = w3.eth.contract(address=Web3.to_checksum_address(address), abi=abi)
+        _CONTRACT_CACHE[key] = contract
+    return contract
+
+# Contract objects for every known token and the router, built once at import
+ERC20_CONTRACTS: Dict[str, Any] = {sym: _get_contract(t["address"]) for sym, t in TOKEN_MAP.items()}
+UNISWAP_CONTRACT = _get_contract(UNISWAP_ROUTER, UNISWAP_ROUTER_ABI)
+
+def multicall_read(calls: List[tuple], allow_failure: bool = False, block_identifier: Any = "latest") -> List[Any]:
+    """Run (contract, fn_name, args) view calls in one eth_call through Multicall3.
+
+    Results are decoded with each function's output types; with allow_failure a
+    reverted call yields None instead of failing the whole batch.
+    """
+    multicall = _get_contract(MULTICALL3_ADDRESS, MULTICALL3_ABI)
+    results = multicall.functions.aggregate3([
+        (contract.address, allow_failure, contract.encode_abi(fn_name, args=list(args)))
+        for contract, fn_name, args in calls
+    ]).call(block_identifier=block_identifier)
+
+    values = []
+    for (contract, fn_name, _), (success, data) in zip(calls, results):
+        if not success:
+            values.append(None)
+            continue
+        types = [o["type"] for o in contract.get_function_by_name(fn_name).abi["outputs"]]
+        decoded = decode(types, data)
+        values.append(decoded[0] if len(decoded) == 1 else decoded)
+    return values
+
+def get_token_info_batch(tokens: List[str], holder_address: str,
+                         block_identifier: Any = "latest") -> Dict[str, Dict[str, Any]]:
+    """balanceOf (+ decimals when not cached yet) for several tokens in a single Multicall3 round trip.
+
+    The native-ETH sentinel is read with Multicall3.getEthBalance, so ETH and token
+    balances come from the same block.
+    """
+    multicall = _get_contract(MULTICALL3_ADDRESS, MULTICALL3_ABI)
+    calls = [
+        (multicall, "getEthBalance", (holder_address,)) if t.lower() == NATIVE_ETH_ADDRESS.lower()
+        else (_get_contract(t), "balanceOf", (holder_address,))
+        for t in tokens
+    ]
+    missing = [t for t in tokens if t.lower() not in _DECIMALS_CACHE]
+    calls += [(_get_contract(t), "decimals", ()) for t in missing]
+    values = multicall_read(calls, block_identifier=block_identifier)
+
+    for token_address, decimals in zip(missing, values[len(tokens):]):
+        _DECIMALS_CACHE[token_address.lower()] = decimals
+
+    info = {}
+    for token_address, balance in zip(tokens, values):
+        decimals = _DECIMALS_CACHE[token_address.lower()]
+        info[token_address] = {
+            "balance_base": balance,
+            "decimals": decimals,
+            "balance": balance / _POW10[decimals],
+        }
+    return info
+
+def get_token_info(token_address: str, holder_address: str, block_identifier: Any = "latest") -> tuple:
+    """(decimals, balance) for one token in a single Multicall3 eth_call"""
+    info = get_token_info_batch([token_address], holder_address, block_identifier)[token_address]
+    return info["decimals"], info["balance"]
+
 def get_token_balance(token_address: str, holder_address: str) -> float:
     """Get token balance for an address"""
-    token = w3.eth.contract(address=token_address, abi=ERC20_ABI)
-    balance = token.functions.balanceOf(holder_address).call()
-    decimals = token.functions.decimals().call()
-    return balance / (10 ** decimals)
+    return get_token_info(token_address, holder_address)[1]
 
-def fund_account_with_eth(to_address: str, amount_eth: float):
-    """Fund an address with ETH on Tenderly fork"""
+def fund_accounts_with_eth(entries: List[tuple]):
+    """Fund several (address, amount_eth) pairs on the Tenderly fork in one JSON-RPC batch"""
     if not IS_TESTING:
-        logger.warning("fund_account_with_eth called in production mode - skipping")
+        logger.warning("fund_accounts_with_eth called in production mode - skipping")
+        return
+    if not entries:
         return
     
-    amount_wei = w3.to_wei(amount_eth, 'ether')
-    amount_hex = hex(amount_wei)
-    
-    w3.provider.make_request("tenderly_setBalance", [to_address, amount_hex])
-    logger.info(f"✓ Funded {to_address} with {amount_eth} ETH on fork")
+    batch_rpc([
+        ("tenderly_setBalance", [to_address, hex(w3.to_wei(amount_eth, 'ether'))])
+        for to_address, amount_eth in entries
+    ])
+    for to_address, amount_eth in entries:
+        logger.info("✓ Funded %s with %s ETH on fork", to_address, amount_eth)
+
+def fund_account_with_eth(to_address: str, amount_eth: float):
+    """Fund an address with ETH on Tenderly fork"""
+    fund_accounts_with_eth([(to_address, amount_eth)])
+
+def set_erc20_balance(token_address: str, holder_address: str, amount_base: int) -> bool:
+    """Set a token balance directly on the Tenderly fork; False if the RPC doesn't support it"""
+    if not IS_TESTING:
+        logger.warning("set_erc20_balance called in production mode - skipping")
+        return False
+    try:
+        batch_rpc([("tenderly_setErc20Balance", [token_address, holder_address, hex(amount_base)])])
+    except (RuntimeError, requests.RequestException) as e:
+        logger.warning("tenderly_setErc20Balance failed, falling back to whale transfer: %s", e)
+        return False
+    logger.info("✓ Set %s balance of %s to %s on fork", token_address, holder_address, amount_base)
+    return True
+
+def batch_rpc(calls: List[tuple]) -> List[Any]:
+    """Send (method, params) pairs as one JSON-RPC batch and return the results in call order"""
+    payload = [
+        {"jsonrpc": "2.0", "id": i, "method": method, "params": params}
+        for i, (method, params) in enumerate(calls)
+    ]
+    resp = HTTP.post(
+        w3.provider.endpoint_uri,
+        json=payload,
+        headers={"Content-Type": "application/json"},
+        timeout=15,
+    )
+    resp.raise_for_status()
+    body = resp.json()
+    # A provider that rejects the whole batch answers with a single error object
+    if isinstance(body, dict):
+        raise RuntimeError(f"RPC batch rejected: {body.get('error')}")
+
+    # Batch responses may come back in any order
+    by_id = {item.get("id"): item for item in body}
+    results = []
+    for i, (method, _) in enumerate(calls):
+        item = by_id.get(i)
+        if item is None or "error" in item:
+            raise RuntimeError(f"{method} failed in RPC batch: {(item or {}).get('error')}")
+        results.append(item["result"])
+    return results
+
+# Sentinel address TOKEN_MAP uses for native ETH
+NATIVE_ETH_ADDRESS = "0xEeeeeEeeeEeEeeEeEeEeeEEEeeeeEeeeeeeeEEeE"
+_DECIMALS_CACHE.setdefault(NATIVE_ETH_ADDRESS.lower(), 18)
+
+def _balance_call(token_address: str, holder_address: str, block_tag: str = "latest") -> tuple:
+    """(method, params) reading a holder's balance of a token (eth_getBalance for native ETH)"""
+    if token_address.lower() == NATIVE_ETH_ADDRESS.lower():
+        return ("eth_getBalance", [holder_address, block_tag])
+    data = _get_contract(token_address).encode_abi("balanceOf", args=[holder_address])
+    return ("eth_call", [{"to": token_address, "data": data}, block_tag])
+
+def fetch_swap_chain_state(from_addr: str, token_symbol: str) -> Dict[str, Any]:
+    """Gas price, nonces (sender + token whale) and input-token balance in one JSON-RPC batch"""
+    token = TOKEN_MAP[token_symbol]
+    whale_addr = WHALES.get(token_symbol)
+    calls = [
+        ("eth_gasPrice", []),
+        ("eth_getTransactionCount", [from_addr, "latest"]),
+        _balance_call(token["address"], from_addr),
+    ]
+    if whale_addr:
+        calls.append(("eth_getTransactionCount", [whale_addr, "latest"]))
+    results = batch_rpc(calls)
+
+    balance_base = int(results[2], 16)
+    return {
+        "gas_price": int(results[0], 16),
+        "nonce": int(results[1], 16),
+        "whale_nonce": int(results[3], 16) if whale_addr else None,
+        "balance_base": balance_base,
+        "balance": balance_base / _POW10[token["decimals"]],
+    }
 
 # Cell 13: Node 1 - Intent Interpretation (FIXED)
-def node_interpret_intent(state: AgentState) -> AgentState:
+INTENT_SYSTEM_PROMPT = (
+    "You are a helper that MUST output strictly valid JSON matching this schema: "
+    "{action, asset_in, asset_out, amount}. "
+    "Fields:\n"
+    "- action: one of \"swap\", \"buy\", \"sell\"\n"
+    "- asset_in: token symbol or contract address\n"
+    "- asset_out: token symbol or contract address\n"
+    "- amount: numeric (float), positive\n\n"
+    "Return only the JSON object."
+)
+
+INTENT_EXAMPLES = [
+    {"user": "Swap $200 of USDC to ETH", "assistant": {"action":"swap","asset_in":"USDC","asset_out":"ETH","amount":200}},
+    {"user": "buy 0.1 ETH with USDC", "assistant": {"action":"buy","asset_in":"USDC","asset_out":"ETH","amount":0.1}},
+    {"user": "sell 10 DAI for USDC", "assistant": {"action":"sell","asset_in":"DAI","asset_out":"USDC","amount":10}}
+]
+
+# System prompt + few-shot examples are identical for every request, so the
+# message prefix is built once (and stays byte-identical for Gemini prefix caching)
+_INTENT_PROMPT_PREFIX = [("system", INTENT_SYSTEM_PROMPT)] + [
+    pair
+    for ex in INTENT_EXAMPLES
+    for pair in (("user", ex["user"]), ("assistant", json.dumps(ex["assistant"])))
+]
+
+def _chunk_text(content: Any) -> str:
+    """Text of a streamed message chunk: a plain string, or a list of parts (Gemini)
+
+    >>> _chunk_text('{"action": ')
+    '{"action": '
+    >>> _chunk_text([{"type": "text", "text": '{"a": '}, "1}", {"type": "image_url"}])
+    '{"a": 1}'
+    """
+    if isinstance(content, str):
+        return content
+    return "".join(
+        part if isinstance(part, str) else part.get("text", "")
+        for part in content or []
+        if isinstance(part, (str, dict))
+    )
+
+def stream_intent_json(user_input: str) -> str:
+    """Stream the LLM reply and stop as soon as the JSON object is closed"""
+    buf = ""
+    for chunk in llm.stream(_INTENT_PROMPT_PREFIX + [("user", user_input)]):
+        buf += _chunk_text(chunk.content)
+        opened = buf.count("{")
+        if opened and opened == buf.count("}"):
+            break
+    # Drop any ```json fences / prose around the object
+    start, end = buf.find("{"), buf.rfind("}")
+    return buf[start:end + 1] if start != -1 and end != -1 else buf
+
+async def node_interpret_intent(state: AgentState) -> AgentState:
     """Parse user input into structured intent using LLM"""
-    logger.info(f"\n{'='*60}")
-    logger.info(f"NODE 1: INTERPRET INTENT")
+    logger.info("\n" + "="*60)
+    logger.info("NODE 1: INTERPRET INTENT")
     speak_text("NODE 1: INTERPRET INTENT")
-    logger.info(f"{'='*60}")
-    logger.info(f"User input: {state['user_input']}")
+    logger.info("="*60)
+    logger.info("User input: %s", state['user_input'])
     speak_text(f"User input: {state['user_input']}")
     
-    system_prompt = (
-        "You are a helper that MUST output strictly valid JSON matching this schema: "
-        "{action, asset_in, asset_out, amount}. "
-        "Fields:\n"
-        "- action: one of \"swap\", \"buy\", \"sell\"\n"
-        "- asset_in: token symbol or contract address\n"
-        "- asset_out: token symbol or contract address\n"
-        "- amount: numeric (float), positive\n\n"
-        "Return only the JSON object."
-    )
-
-    examples = [
-        {"user": "Swap $200 of USDC to ETH", "assistant": {"action":"swap","asset_in":"USDC","asset_out":"ETH","amount":200}},
-        {"user": "buy 0.1 ETH with USDC", "assistant": {"action":"buy","asset_in":"USDC","asset_out":"ETH","amount":0.1}},
-        {"user": "sell 10 DAI for USDC", "assistant": {"action":"sell","asset_in":"DAI","asset_out":"USDC","amount":10}}
-    ]
-
-    messages = [("system", system_prompt)]
-    for ex in examples:
-        messages.append(("user", ex["user"]))
-        messages.append(("assistant", json.dumps(ex["assistant"])))
-        
-    resp = llm.invoke(messages+[("user", state["user_input"])])
+    raw = await asyncio.to_thread(stream_intent_json, state["user_input"])
     
     try:
-        parsed = json.loads(resp.content)
-        logger.info(f"LLM raw response: {parsed}")
+        parsed = json.loads(raw)
+        logger.info("LLM raw response: %s", parsed)
     except Exception as e:
-        logger.error(f"Could not parse JSON from LLM: {e}")
+        logger.error("Could not parse JSON from LLM: %s", e)
         state["error"] = "Could not parse JSON from LLM"
         state["status"] = "failed"
         return state  # ✅ FIX: Return state, not dict
 
     try:
         info = Info.model_validate(parsed)
-        logger.info(f"✓ Intent parsed successfully:")
-        logger.info(f"  Action: {info.action}")
-        logger.info(f"  Asset In: {info.asset_in}")
-        logger.info(f"  Asset Out: {info.asset_out}")
-        logger.info(f"  Amount: {info.amount}")
+        logger.info("✓ Intent parsed successfully:")
+        logger.info("  Action: %s", info.action)
+        logger.info("  Asset In: %s", info.asset_in)
+        logger.info("  Asset Out: %s", info.asset_out)
+        logger.info("  Amount: %s", info.amount)
         speak_text(f"Intent parsed successfully:")
         speak_text(f"Action: {info.action}")
         speak_text(f"Asset In: {info.asset_in}")
         speak_text(f"Asset Out: {info.asset_out}")
         speak_text(f"Amount: {info.amount}")
     except ValidationError as e:
-        logger.error(f"Validation failed: {e}")
+        logger.error("Validation failed: %s", e)
         state["error"] = f"Validation failed: {e}"
         state["status"] = "failed"
         return state  # ✅ FIX: Return state, not dict
@@ -1145,73 +1446,115 @@ SYMBOL_TO_ID = {
     "MATIC": "matic-network",
     "BNB": "binancecoin",
     "SOL": "solana",
-    "DAI": "dai"
+    "DAI": "dai",
+    "USDT": "tether",
+    "1INCH": "1inch",
+    "LINK": "chainlink",
+    "WBTC": "wrapped-bitcoin"
 }
 
-def get_price_usd(token_symbol: str) -> float:
+# Ids resolved through /search on earlier runs
+SYMBOL_ID_CACHE_FILE = "symbol_id_cache.json"
+if os.path.exists(SYMBOL_ID_CACHE_FILE):
+    with open(SYMBOL_ID_CACHE_FILE) as f:
+        for sym, token_id in json.load(f).items():
+            SYMBOL_TO_ID.setdefault(sym, token_id)
+
+def resolve_coingecko_id(token_symbol: str) -> str:
+    """Map a symbol to its CoinGecko id, using /search (and caching the result) on a miss"""
     token_symbol = token_symbol.upper()
     token_id = SYMBOL_TO_ID.get(token_symbol)
 
     if token_id is None:
-        all_coins = requests.get(f"{COINGECKO_API_URL}/coins/list", timeout=10).json()
-        for c in all_coins:
+        headers = {"x-cg-demo-api-key": COINGECKO_API_KEY}
+        resp = HTTP.get(f"{COINGECKO_API_URL}/search", params={"query": token_symbol},
+                        headers=headers, timeout=5)
+        resp.raise_for_status()
+        for c in resp.json().get("coins", []):
             if c["symbol"].lower() == token_symbol.lower():
                 token_id = c["id"]
-                SYMBOL_TO_ID[token_symbol] = token_id
                 break
         if token_id is None:
             raise ValueError(f"Token symbol '{token_symbol}' not found on CoinGecko")
 
-    params = {"ids": token_id, "vs_currencies": "usd"}
+        SYMBOL_TO_ID[token_symbol] = token_id
+        try:
+            cached = {}
+            if os.path.exists(SYMBOL_ID_CACHE_FILE):
+                with open(SYMBOL_ID_CACHE_FILE) as f:
+                    cached = json.load(f)
+            cached[token_symbol] = token_id
+            with open(SYMBOL_ID_CACHE_FILE, "w") as f:
+                json.dump(cached, f, indent=2)
+        except (OSError, ValueError) as e:
+            logger.warning("Could not update %s: %s", SYMBOL_ID_CACHE_FILE, e)
+    return token_id
+
+def get_prices_usd(symbols: List[str]) -> Dict[str, float]:
+    """USD prices for several symbols in one /simple/price request (comma-separated ids)"""
+    ids = {sym: resolve_coingecko_id(sym) for sym in symbols}
+
+    params = {"ids": ",".join(sorted(set(ids.values()))), "vs_currencies": "usd"}
     headers = {"x-cg-demo-api-key": COINGECKO_API_KEY}
-    resp = requests.get(f"{COINGECKO_API_URL}/simple/price", 
+    resp = HTTP.get(f"{COINGECKO_API_URL}/simple/price", 
                        params=params, headers=headers, timeout=10)
     resp.raise_for_status()
     data = resp.json()
-    return float(data[token_id]["usd"])
-
-# Cell 14: Node 2 - Price Fetch (FIXED)
-def node_price_fetch(state: AgentState) -> AgentState:
-    """Fetch USD price for the asset"""
-    logger.info(f"\n{'='*60}")
-    logger.info(f"NODE 2: PRICE FETCH")
-    speak_text(f"NODE 2: PRICE FETCH")
-    logger.info(f"{'='*60}")
+    # Ids CoinGecko has no price for are left out rather than raising KeyError
+    return {
+        sym: float(data[token_id]["usd"])
+        for sym, token_id in ids.items()
+        if "usd" in data.get(token_id, {})
+    }
+
+def get_price_usd(token_symbol: str) -> float:
+    return get_prices_usd([token_symbol])[token_symbol]
+
+# Cell 15: Quote helpers
+def fetch_oneinch_quote(from_token: Dict[str, Any], to_token: Dict[str, Any], amount_base: int, from_addr: str) -> Dict[str, Any]:
+    """Real swap quote from the 1inch API (production)"""
+    params = {
+        "src": from_token["address"],
+        "dst": to_token["address"],
+        "amount": str(amount_base),
+        "from": from_addr,
+        "slippage": "1"
+    }
     
-    asset = state["intent"]["asset_in"]
-    logger.info(f"Fetching price for: {asset}")
-    speak_text(f"Fetching price for: {asset}")
+    headers = {"Authorization": f"Bearer {ONEINCH_API_KEY}"}
+    resp = HTTP.get(ONEINCH_QUOTE_URL, params=params, headers=headers, timeout=10)
     
-    try:
-        price = get_price_usd(asset)
-        total_usd = price * float(state["intent"]["amount"])
-        
-        logger.info(f"✓ Price fetched:")
-        logger.info(f"  {asset} price: ${price:,.2f}")
-        logger.info(f"  Total value: ${total_usd:,.2f}")
-        speak_text("Price fetched:")
-        speak_text(f"{asset} price: ${price:,.2f}")
-        speak_text(f"Total value: ${total_usd:,.2f}")
-        
-        # ✅ FIX: Update state directly
-        state["price_usd"] = total_usd
-        state["memory"]["price_usd"] = total_usd
-        state["memory"]["token_price"] = price
-        return state  # Return the modified state
-    except Exception as e:
-        logger.error(f"Price fetch failed: {e}")
-        state["error"] = f"Price fetch failed: {e}"
-        state["status"] = "failed"
-        return state
-
+    if not resp.ok:
+        logger.error("1inch quote failed: %s - %s", resp.status_code, resp.text[:500])
+        resp.raise_for_status()
+    return resp.json()
+
+def simulate_quote(from_token: Dict[str, Any], to_token: Dict[str, Any], amount: float, amount_base: int,
+                   price_in: float, price_out: float) -> Dict[str, Any]:
+    """Approximate quote from USD prices (testing mode, Uniswap does the actual swap)"""
+    # Scale in Decimal: a float times 10**18 silently loses the low digits
+    with localcontext() as ctx:
+        ctx.prec = 60
+        estimated_out_tokens = Decimal(str(amount)) * Decimal(str(price_in)) / Decimal(str(price_out))
+        estimated_out_base = int(estimated_out_tokens * _POW10_DEC[to_token["decimals"]])
+    
+    return {
+        "toAmount": str(estimated_out_base),
+        "fromToken": from_token,
+        "toToken": to_token,
+        "fromAmount": str(amount_base),
+        "estimatedGas": "200000",
+        "protocols": [["UNISWAP_V3"]],
+        "testing_mode": True
+    }
 
-# Cell 15: Node 3 - Quote (Fork-aware)
-def node_quote_fetch(state: AgentState) -> AgentState:
-    """Get swap quote - uses different methods for testing vs production"""
-    logger.info(f"\n{'='*60}")
-    logger.info(f"NODE 3: QUOTE FETCH")
-    speak_text("NODE 3: QUOTE FETCH")
-    logger.info(f"{'='*60}")
+# Cell 15: Node 2 - Prepare Swap (price + quote + chain state, fused)
+async def node_prepare_swap(state: AgentState) -> AgentState:
+    """Fetch prices, the quote and on-chain swap state concurrently"""
+    logger.info("\n" + "="*60)
+    logger.info("NODE 2: PREPARE SWAP")
+    speak_text("NODE 2: PREPARE SWAP")
+    logger.info("="*60)
     
     try:
         intent = state.get("intent")
@@ -1232,87 +1575,84 @@ def node_quote_fetch(state: AgentState) -> AgentState:
         from_token = TOKEN_MAP[a_in]
         to_token = TOKEN_MAP[a_out]
         amount_base = resolve_amount_to_base(amount, from_token["decimals"])
+        from_addr = state.get("user_wallet")
         
-        logger.info(f"Quote parameters:")
-        logger.info(f"  From: {a_in} ({from_token['address']})")
-        logger.info(f"  To: {a_out} ({to_token['address']})")
-        logger.info(f"  Amount: {amount} {a_in} ({amount_base} base units)")
+        logger.info("Quote parameters:")
+        logger.info("  From: %s (%s)", a_in, from_token['address'])
+        logger.info("  To: %s (%s)", a_out, to_token['address'])
+        logger.info("  Amount: %s %s (%s base units)", amount, a_in, amount_base)
         speak_text(f"Quote parameters:")
         speak_text(f"From: {a_in} ({from_token['address']})")
         speak_text(f"To: {a_out} ({to_token['address']})")
         speak_text(f"Amount: {amount} {a_in} ({amount_base} base units)")
 
+        # CoinGecko and the RPC / 1inch calls hit different hosts, so run them side by side.
+        # Only the simulated (testing) quote needs a price for asset_out.
+        price_symbols = [a_in, a_out] if IS_TESTING else [a_in]
+        price_task = asyncio.to_thread(get_prices_usd, price_symbols)
         if IS_TESTING:
-            # In testing mode, we simulate a quote based on current prices
-            logger.info(f"⚠️  TESTING MODE: Simulating quote (Uniswap will be used for actual swap)")
-            
-            # Get approximate output based on current prices
-            price_in = state["memory"].get("token_price", get_price_usd(a_in))
-            price_out = get_price_usd(a_out)
-            
-            estimated_out_usd = amount * price_in
-            estimated_out_tokens = estimated_out_usd / price_out
-            estimated_out_base = int(estimated_out_tokens * (10 ** to_token["decimals"]))
+            side_task = asyncio.to_thread(fetch_swap_chain_state, from_addr, a_in) if from_addr else asyncio.sleep(0)
+        else:
+            side_task = asyncio.to_thread(fetch_oneinch_quote, from_token, to_token, amount_base, from_addr)
+        prices, side_result = await asyncio.gather(price_task, side_task)
+        
+        price_in, price_out = prices.get(a_in), prices.get(a_out)
+        missing = [sym for sym in price_symbols if prices.get(sym) is None]
+        if missing:
+            state["status"] = "failed"
+            state["error"] = f"no USD price for: {', '.join(missing)}"
+            return state
+        total_usd = price_in * amount
+        # Thousands-separated formatting has no %-style equivalent, so only do it when INFO is on
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("✓ Price fetched:")
+            logger.info("  %s price: $%s", a_in, format(price_in, ",.2f"))
+            logger.info("  Total value: $%s", format(total_usd, ",.2f"))
+        speak_text("Price fetched:")
+        speak_text(f"{a_in} price: ${price_in:,.2f}")
+        speak_text(f"Total value: ${total_usd:,.2f}")
+        
+        state["price_usd"] = total_usd
+        state["memory"]["price_usd"] = total_usd
+        state["memory"]["token_price"] = price_in
+
+        if IS_TESTING:
+            logger.info("⚠️  TESTING MODE: Simulating quote (Uniswap will be used for actual swap)")
+            if side_result:
+                state["memory"]["chain_state"] = side_result
             
-            quote = {
-                "toAmount": str(estimated_out_base),
-                "fromToken": from_token,
-                "toToken": to_token,
-                "fromAmount": str(amount_base),
-                "estimatedGas": "200000",
-                "protocols": [["UNISWAP_V3"]],
-                "testing_mode": True
-            }
+            quote = simulate_quote(from_token, to_token, amount, amount_base, price_in, price_out)
+            estimated_out_tokens = int(quote["toAmount"]) / _POW10[to_token["decimals"]]
             
-            logger.info(f"✓ Simulated quote:")
-            logger.info(f"  Estimated output: {estimated_out_tokens:.6f} {a_out}")
-            logger.info(f"  Rate: 1 {a_in} ≈ {estimated_out_tokens/amount:.6f} {a_out}")
+            logger.info("✓ Simulated quote:")
+            logger.info("  Estimated output: %.6f %s", estimated_out_tokens, a_out)
+            logger.info("  Rate: 1 %s ≈ %.6f %s", a_in, estimated_out_tokens/amount, a_out)
             speak_text(f"Simulated quote:")
             speak_text(f"Estimated output: {estimated_out_tokens:.6f} {a_out}")
             speak_text(f"Rate: 1 {a_in} ≈ {estimated_out_tokens/amount:.6f} {a_out}")
-            
         else:
-            # Production mode - use 1inch API
-            logger.info(f"PRODUCTION MODE: Fetching real quote from 1inch")
-            from_addr = state.get("user_wallet")
-            
-            params = {
-                "src": from_token["address"],
-                "dst": to_token["address"],
-                "amount": str(amount_base),
-                "from": from_addr,
-                "slippage": "1"
-            }
-            
-            headers = {"Authorization": f"Bearer {ONEINCH_API_KEY}"}
-            resp = requests.get(ONEINCH_QUOTE_URL, params=params, headers=headers, timeout=10)
-            
-            if not resp.ok:
-                logger.error(f"1inch quote failed: {resp.status_code} - {resp.text[:500]}")
-                resp.raise_for_status()
-            
-            quote = resp.json()
-            output_amount = int(quote["toAmount"]) / (10 ** to_token["decimals"])
-            logger.info(f"✓ Quote received from 1inch:")
-            logger.info(f"  Output: {output_amount:.6f} {a_out}")
+            quote = side_result
+            output_amount = int(quote["toAmount"]) / _POW10[to_token["decimals"]]
+            logger.info("✓ Quote received from 1inch:")
+            logger.info("  Output: %.6f %s", output_amount, a_out)
 
         state["quote"] = quote
         state["status"] = "quote_ready"
         return state
 
     except Exception as e:
-        logger.error(f"Quote fetch failed: {e}")
+        logger.error("Prepare swap failed: %s", e)
         state["status"] = "failed"
         state["error"] = str(e)
         return state
 
 # Cell 16: Node 4 - Build Swap (FIXED)
-def node_build_swap(state: AgentState) -> AgentState:
+async def node_build_swap(state: AgentState) -> AgentState:
     """Build swap transaction - uses Uniswap for testing, 1inch for production"""
-    logger.info(f"\n{'='*60}")
-    logger.info(f"NODE 4: BUILD SWAP")
+    logger.info("\n" + "="*60)
+    logger.info("NODE 4: BUILD SWAP")
     speak_text(f"NODE 4: BUILD SWAP")
-    logger.info(f"{'='*60}")
+    logger.info("="*60)
     
     try:
         intent = state.get("intent")
@@ -1341,64 +1681,87 @@ def node_build_swap(state: AgentState) -> AgentState:
             return state
 
         if IS_TESTING:
-            logger.info(f"⚠️  TESTING MODE: Building Uniswap V3 swap")
+            logger.info("⚠️  TESTING MODE: Building Uniswap V3 swap")
+            
+            # Gas price, nonces and balance were fetched by PREPARE_SWAP (one RPC batch).
+            # HUMAN_CONFIRM can wait indefinitely, so after a confirmation they are refetched.
+            chain_state = None if state.get("confirmation_required") else state["memory"].get("chain_state")
+            if chain_state is None:
+                chain_state = await asyncio.to_thread(fetch_swap_chain_state, from_addr, a_in)
+            whale_addr = WHALES.get(a_in)
+            gas_price = chain_state["gas_price"]
+            nonce = chain_state["nonce"]
+            whale_nonce = chain_state["whale_nonce"]
+            # Passing chainId stops build_transaction from asking the node for it per tx
+            chain_id = await asyncio.to_thread(get_chain_id)
+            
+            initial_balance = chain_state["balance"]
+            logger.info("Initial %s balance: %.6f", a_in, initial_balance)
+            speak_text(f"Initial {a_in} balance: {initial_balance:.6f}")
             
-            # Setup whale address if needed
+            # ETH for gas (batched with any other top-ups)
+            funding = []
             if from_addr in WHALES.values():
-                logger.info(f"Using whale address: {from_addr}")
+                logger.info("Using whale address: %s", from_addr)
                 speak_text(f"Using whale address: {from_addr}")
             else:
-                logger.info(f"Funding test address: {from_addr}")
+                logger.info("Funding test address: %s", from_addr)
                 speak_text(f"Funding test address: {from_addr}")
-                fund_account_with_eth(from_addr, 10)
+                funding.append((from_addr, 10))
             
-            # Check and log balances
-            initial_balance = get_token_balance(from_token["address"], from_addr)
-            logger.info(f"Initial {a_in} balance: {initial_balance:.6f}")
-            speak_text(f"Initial {a_in} balance: {initial_balance:.6f}")
+            await asyncio.to_thread(fund_accounts_with_eth, funding)
             
+            # Top up the token balance with a state override; a real whale transfer is the fallback
+            needs_whale_transfer = False
             if initial_balance < amount:
-                logger.warning(f"⚠️  Insufficient balance! Has {initial_balance}, needs {amount}")
-                if a_in in WHALES:
-                    whale_addr = WHALES[a_in]
-                    fund_account_with_eth(whale_addr, 10)
-                    
-                    token_contract = w3.eth.contract(address=from_token["address"], abi=ERC20_ABI)
-                    transfer_tx = token_contract.functions.transfer(
-                        from_addr,
-                        amount_base
-                    ).build_transaction({
-                        'from': whale_addr,
-                        'gas': 100000,
-                        'gasPrice': w3.eth.gas_price,
-                        'nonce': w3.eth.get_transaction_count(whale_addr)
-                    })
-                    
-                    tx_hash = w3.eth.send_transaction(transfer_tx)
-                    w3.eth.wait_for_transaction_receipt(tx_hash)
-                    logger.info(f"✓ Transferred {amount} {a_in} from whale to test address")
-                    speak_text(f"✓ Transferred {amount} {a_in} from whale to test address")
+                logger.warning("⚠️  Insufficient balance! Has %s, needs %s", initial_balance, amount)
+                if await asyncio.to_thread(set_erc20_balance, from_token["address"], from_addr, amount_base * 2):
+                    speak_text(f"✓ Set {a_in} balance of test address on fork")
+                elif whale_addr:
+                    needs_whale_transfer = True
+                    await asyncio.to_thread(fund_account_with_eth, whale_addr, 10)
+            
+            if needs_whale_transfer:
+                token_contract = ERC20_CONTRACTS[a_in]
+                transfer_tx = token_contract.functions.transfer(
+                    from_addr,
+                    amount_base
+                ).build_transaction({
+                    'from': whale_addr,
+                    'gas': 100000,
+                    'gasPrice': gas_price,
+                    'nonce': whale_nonce,
+                    'chainId': chain_id
+                })
+                
+                tx_hash = await asyncio.to_thread(w3.eth.send_transaction, transfer_tx)
+                await asyncio.to_thread(w3.eth.wait_for_transaction_receipt, tx_hash)
+                if whale_addr.lower() == from_addr.lower():
+                    nonce += 1
+                logger.info("✓ Transferred %s %s from whale to test address", amount, a_in)
+                speak_text(f"✓ Transferred {amount} {a_in} from whale to test address")
             
             # Approve Uniswap router
-            logger.info(f"Approving Uniswap router...")
+            logger.info("Approving Uniswap router...")
             speak_text("Approving Uniswap router")
-            token_contract = w3.eth.contract(address=from_token["address"], abi=ERC20_ABI)
+            token_contract = ERC20_CONTRACTS[a_in]
             approve_tx = token_contract.functions.approve(
                 UNISWAP_ROUTER,
                 amount_base
             ).build_transaction({
                 'from': from_addr,
                 'gas': 100000,
-                'gasPrice': w3.eth.gas_price,
-                'nonce': w3.eth.get_transaction_count(from_addr)
+                'gasPrice': gas_price,
+                'nonce': nonce,
+                'chainId': chain_id
             })
             
-            logger.info(f"✓ Approval transaction built")
+            logger.info("✓ Approval transaction built")
             speak_text("Approval transaction built")
             
             # Build Uniswap swap transaction
             deadline = int(time.time()) + 300
-            uniswap_router = w3.eth.contract(address=UNISWAP_ROUTER, abi=UNISWAP_ROUTER_ABI)
+            uniswap_router = UNISWAP_CONTRACT
             
             swap_params = {
                 'tokenIn': from_token["address"],
@@ -1416,14 +1779,15 @@ def node_build_swap(state: AgentState) -> AgentState:
             ).build_transaction({
                 'from': from_addr,
                 'gas': 300000,
-                'gasPrice': w3.eth.gas_price,
-                'nonce': w3.eth.get_transaction_count(from_addr) + 1,
+                'gasPrice': gas_price,
+                'nonce': nonce + 1,
+                'chainId': chain_id,
                 'value': 0
             })
             
-            logger.info(f"✓ Uniswap swap transaction built:")
-            logger.info(f"  Router: {UNISWAP_ROUTER}")
-            logger.info(f"  Gas estimate: {swap_tx['gas']}")
+            logger.info("✓ Uniswap swap transaction built:")
+            logger.info("  Router: %s", UNISWAP_ROUTER)
+            logger.info("  Gas estimate: %s", swap_tx['gas'])
             speak_text(f"Uniswap swap transaction built:")
             speak_text(f"Router: {UNISWAP_ROUTER}")
             speak_text(f"Gas estimate: {swap_tx['gas']}")
@@ -1437,7 +1801,7 @@ def node_build_swap(state: AgentState) -> AgentState:
             }
             
         else:
-            logger.info(f"PRODUCTION MODE: Building 1inch swap")
+            logger.info("PRODUCTION MODE: Building 1inch swap")
             
             params = {
                 "src": from_token["address"],
@@ -1448,56 +1812,58 @@ def node_build_swap(state: AgentState) -> AgentState:
             }
             
             headers = {"Authorization": f"Bearer {ONEINCH_API_KEY}"}
-            resp = requests.get(ONEINCH_SWAP_URL, params=params, headers=headers, timeout=15)
+            resp = await asyncio.to_thread(HTTP.get, ONEINCH_SWAP_URL, params=params, headers=headers, timeout=15)
             
             if not resp.ok:
-                logger.error(f"1inch swap failed: {resp.status_code} - {resp.text[:500]}")
+                logger.error("1inch swap failed: %s - %s", resp.status_code, resp.text[:500])
                 resp.raise_for_status()
             
             swap_resp = resp.json()
             tx_obj = swap_resp.get("tx") or swap_resp
             
-            logger.info(f"✓ 1inch swap transaction built:")
-            logger.info(f"  To: {tx_obj.get('to')}")
-            logger.info(f"  Gas estimate: {tx_obj.get('gas')}")
+            logger.info("✓ 1inch swap transaction built:")
+            logger.info("  To: %s", tx_obj.get('to'))
+            logger.info("  Gas estimate: %s", tx_obj.get('gas'))
             
             # ✅ CRITICAL FIX: Store in state directly
             state["swap_transaction"] = tx_obj
 
         # ✅ CRITICAL FIX: Update status in state
         state["status"] = "swap_ready"
-        logger.info(f"\n✓ Swap transaction ready for execution")
+        logger.info("\n✓ Swap transaction ready for execution")
         
         # ✅ Return the modified state object
         return state
 
     except Exception as e:
-        logger.error(f"Build swap failed: {e}")
+        logger.error("Build swap failed: %s", e)
         import traceback
         logger.error(traceback.format_exc())
         state["status"] = "failed"
         state["error"] = str(e)
-        logger.info(f"DEBUG: keys in state after build_swap: {list(state.keys())}")
+        logger.info("DEBUG: keys in state after build_swap: %s", list(state.keys()))
         return state
 
 
-def node_decide(state: AgentState) -> AgentState:
+async def node_decide(state: AgentState) -> AgentState:
     """Determine if human confirmation needed based on risk"""
     total_usd = state["price_usd"]
     
     # Risk thresholds
     if total_usd > 100:
         state["confirmation_required"] = True
-        logger.info(f"⚠️ High value swap (${total_usd:,.2f}) - requires confirmation")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("⚠️ High value swap ($%s) - requires confirmation", format(total_usd, ",.2f"))
         speak_text(f"High value swap (${total_usd:,.2f}) - requires confirmation")
     else:
         state["confirmation_required"] = False
-        logger.info(f"✓ Auto-approve (${total_usd:,.2f} below threshold)")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info("✓ Auto-approve ($%s below threshold)", format(total_usd, ",.2f"))
         speak_text(f"Auto-approve (${total_usd:,.2f} below threshold)")
     
     return state
 
-def node_human_confirm(state: AgentState) -> AgentState:
+async def node_human_confirm(state: AgentState) -> AgentState:
     logger.info("\n" + "="*60)
     logger.info("NODE 6: HUMAN CONFIRMATION")
     logger.info("="*60)
@@ -1507,22 +1873,31 @@ def node_human_confirm(state: AgentState) -> AgentState:
     asset_in = intent.get("asset_in")
     asset_out = intent.get("asset_out")
 
-    logger.info(f"Swap: {amount} {asset_in} → {asset_out}")
-    logger.info(f"Value: ${state.get('price_usd', 0):.2f}")
+    logger.info("Swap: %s %s → %s", amount, asset_in, asset_out)
+    logger.info("Value: $%.2f", state.get('price_usd', 0))
     speak_text(f"Swap: {amount} {asset_in} → {asset_out}")
     speak_text(f"Value: ${state.get('price_usd', 0):.2f}")
 
-    user_input = input("Approve? (yes/no): ").strip().lower()
+    # Pause the graph here; the caller resumes it with Command(resume=<answer>)
+    decision = interrupt({
+        "prompt": "Approve? (yes/no): ",
+        "swap": f"{amount} {asset_in} → {asset_out}",
+        "value_usd": state.get("price_usd"),
+    })
+    user_input = str(decision).strip().lower()
     speak_text(f"User said {user_input}")
     state["user_approved"] = (user_input == "yes")
+    if not state["user_approved"]:
+        logger.warning("❌ User rejected swap")
+        state["status"] = "rejected"
     return state
 
-def node_execute_swap(state: AgentState) -> AgentState:
+async def node_execute_swap(state: AgentState) -> AgentState:
     """Execute the swap transaction"""
-    logger.info(f"\n{'='*60}")
-    logger.info(f"NODE 7: EXECUTE SWAP")
-    logger.info(f"{'='*60}")
-    logger.info(f"DEBUG: keys in state before execution: {list(state.keys())}")
+    logger.info("\n" + "="*60)
+    logger.info("NODE 7: EXECUTE SWAP")
+    logger.info("="*60)
+    logger.info("DEBUG: keys in state before execution: %s", list(state.keys()))
     
     # If confirmation was required and the user did not approve
     if state.get("confirmation_required") and not state.get("user_approved"):
@@ -1546,12 +1921,12 @@ def node_execute_swap(state: AgentState) -> AgentState:
         if isinstance(swap_tx, dict) and "approval_tx" in swap_tx:
             try:
                 logger.info("Step 1: Approving tokens...")
-                approval_hash = w3.eth.send_transaction(swap_tx["approval_tx"])
-                receipt = w3.eth.wait_for_transaction_receipt(approval_hash)
-                logger.info(f"✓ Approval confirmed: {approval_hash.hex()}")
+                approval_hash = await asyncio.to_thread(w3.eth.send_transaction, swap_tx["approval_tx"])
+                receipt = await asyncio.to_thread(w3.eth.wait_for_transaction_receipt, approval_hash)
+                logger.info("✓ Approval confirmed: %s", approval_hash.hex())
                 speak_text("Approval confirmed")
             except Exception as e:
-                logger.error(f"❌ Approval transaction failed: {e}")
+                logger.error("❌ Approval transaction failed: %s", e)
                 state["status"] = "failed"
                 state["error"] = f"Approval failed: {e}"
                 return state
@@ -1559,12 +1934,12 @@ def node_execute_swap(state: AgentState) -> AgentState:
         # Execute the actual swap
         try:
             logger.info("Step 2: Executing swap...")
-            swap_hash = w3.eth.send_transaction(swap_tx["swap_tx"])
-            logger.info(f"✓ Swap submitted: {swap_hash.hex()}")
+            swap_hash = await asyncio.to_thread(w3.eth.send_transaction, swap_tx["swap_tx"])
+            logger.info("✓ Swap submitted: %s", swap_hash.hex())
             speak_text("Swap submitted")
             state["execution_tx_hash"] = swap_hash.hex()
         except Exception as e:
-            logger.error(f"❌ Swap transaction failed: {e}")
+            logger.error("❌ Swap transaction failed: %s", e)
             state["status"] = "failed"
             state["error"] = f"Swap execution failed: {e}"
             return state
@@ -1582,34 +1957,63 @@ def node_execute_swap(state: AgentState) -> AgentState:
     state["status"] = "executed"
     return state
 
-def node_monitor_tx(state: AgentState) -> AgentState:
+def wait_for_receipt(tx_hash: str, timeout: float = 120, poll_interval: float = 0.5):
+    """Poll eth_getTransactionReceipt until the tx is mined"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return w3.eth.get_transaction_receipt(tx_hash)
+        except TransactionNotFound:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Transaction {tx_hash} not mined after {timeout}s")
+            time.sleep(poll_interval)
+
+def get_balances_at_block(tokens: List[str], holder_address: str, block_number: int) -> Dict[str, float]:
+    """ETH + token balances of a holder as of one block, in a single Multicall3 eth_call"""
+    # dict.fromkeys keeps order and drops a repeated ETH sentinel
+    lookup = list(dict.fromkeys([NATIVE_ETH_ADDRESS] + tokens))
+    info = get_token_info_batch(lookup, holder_address, block_identifier=block_number)
+
+    balances = {"ETH": info[NATIVE_ETH_ADDRESS]["balance"]}
+    for token_address in tokens:
+        balances[token_address] = info[token_address]["balance"]
+    return balances
+
+async def node_monitor_tx(state: AgentState) -> AgentState:
     """Monitor transaction until confirmed"""
-    logger.info(f"\n{'='*60}")
-    logger.info(f"NODE 8: MONITOR TRANSACTION")
-    logger.info(f"{'='*60}")
+    logger.info("\n" + "="*60)
+    logger.info("NODE 8: MONITOR TRANSACTION")
+    logger.info("="*60)
     
     tx_hash = state["execution_tx_hash"]
-    logger.info(f"Monitoring tx: {tx_hash}")
+    logger.info("Monitoring tx: %s", tx_hash)
     
     try:
-        receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
+        receipt = await asyncio.to_thread(wait_for_receipt, tx_hash, timeout=120)
         
         if receipt["status"] == 1:
-            logger.info(f"✓ Transaction CONFIRMED")
-            logger.info(f"  Block: {receipt['blockNumber']}")
-            logger.info(f"  Gas used: {receipt['gasUsed']:,}")
+            logger.info("✓ Transaction CONFIRMED")
+            logger.info("  Block: %s", receipt['blockNumber'])
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("  Gas used: %s", format(receipt['gasUsed'], ","))
             speak_text("Transaction CONFIRMED")
             speak_text(f"Block: {receipt['blockNumber']}")
             speak_text(f"Gas used: {receipt['gasUsed']:,}")
             
-            # Check final balances
+            # Check final balances as of the receipt's block (one batched request)
             intent = state["intent"]
             from_token = TOKEN_MAP[intent["asset_in"]]
             to_token = TOKEN_MAP[intent["asset_out"]]
             from_addr = state["user_wallet"]
             
-            final_balance_out = get_token_balance(to_token["address"], from_addr)
-            logger.info(f"  New {intent['asset_out']} balance: {final_balance_out:.6f}")
+            final_balances = await asyncio.to_thread(
+                get_balances_at_block,
+                [from_token["address"], to_token["address"]], from_addr, receipt["blockNumber"]
+            )
+            final_balance_out = final_balances[to_token["address"]]
+            logger.info("  New %s balance: %.6f", intent['asset_in'], final_balances[from_token['address']])
+            logger.info("  New %s balance: %.6f", intent['asset_out'], final_balance_out)
+            logger.info("  ETH balance: %.6f", final_balances['ETH'])
             
             state["status"] = "completed"
             state["memory"]["final_balance"] = final_balance_out
@@ -1619,7 +2023,7 @@ def node_monitor_tx(state: AgentState) -> AgentState:
             state["error"] = "Transaction reverted"
     
     except Exception as e:
-        logger.error(f"❌ Monitoring failed: {e}")
+        logger.error("❌ Monitoring failed: %s", e)
         state["status"] = "failed"
         state["error"] = str(e)
     
@@ -1628,8 +2032,7 @@ def node_monitor_tx(state: AgentState) -> AgentState:
 # Cell 17: Build Graph
 graph = StateGraph(AgentState)
 graph.add_node("INTERPRET_INTENT", node_interpret_intent)
-graph.add_node("PRICE_FETCH", node_price_fetch)
-graph.add_node("QUOTE_FETCH", node_quote_fetch)
+graph.add_node("PREPARE_SWAP", node_prepare_swap)
 graph.add_node("BUILD_SWAP", node_build_swap)
 graph.add_node("DECIDE", node_decide)
 graph.add_node("HUMAN_CONFIRM", node_human_confirm)
@@ -1639,30 +2042,38 @@ graph.add_node("MONITOR",node_monitor_tx)
 graph.set_entry_point("INTERPRET_INTENT")
 graph.set_finish_point("MONITOR")
 
-graph.add_edge("INTERPRET_INTENT", "PRICE_FETCH")
-graph.add_edge("PRICE_FETCH", "QUOTE_FETCH")
-graph.add_edge("QUOTE_FETCH", "BUILD_SWAP")
-graph.add_edge("BUILD_SWAP", "DECIDE")
+# Decide on the priced quote first so rejected swaps never pay for BUILD_SWAP
+graph.add_edge("INTERPRET_INTENT", "PREPARE_SWAP")
+graph.add_edge("PREPARE_SWAP", "DECIDE")
 graph.add_conditional_edges(
     "DECIDE",
-    lambda state: "HUMAN_CONFIRM" if state["confirmation_required"] else "EXECUTE",
+    lambda state: "HUMAN_CONFIRM" if state["confirmation_required"] else "BUILD_SWAP",
     {
         "HUMAN_CONFIRM": "HUMAN_CONFIRM",
-        "EXECUTE": "EXECUTE"
+        "BUILD_SWAP": "BUILD_SWAP"
     }
 )
-graph.add_edge("HUMAN_CONFIRM","EXECUTE")
+graph.add_conditional_edges(
+    "HUMAN_CONFIRM",
+    lambda state: "BUILD_SWAP" if state["user_approved"] else END,
+    {
+        "BUILD_SWAP": "BUILD_SWAP",
+        END: END
+    }
+)
+graph.add_edge("BUILD_SWAP","EXECUTE")
 graph.add_edge("EXECUTE","MONITOR")
 
-app = graph.compile()
+# Checkpointer lets HUMAN_CONFIRM interrupt and resume per thread_id
+app = graph.compile(checkpointer=MemorySaver())
 
 # Cell 18: Visualize Graph
 print(display(Image(app.get_graph().draw_mermaid_png())))
 
 # Cell 19: Test Execution
-print("\n" + "="*80)
-print("DEFI-OPS AGENT TEST EXECUTION")
-print("="*80)
+logger.info("\n" + "="*80)
+logger.info("DEFI-OPS AGENT TEST EXECUTION")
+logger.info("="*80)
 
 # For testing, use a whale address
 test_wallet = WHALES['WETH'] if IS_TESTING else "0xB8db1eF70b0d31c6eCE7695965791A45dE0f0035"
@@ -1685,27 +2096,49 @@ initial_state: AgentState = {
     "llm_log": []
 }
 
-logger.info(f"Starting agent with wallet: {test_wallet}")
+logger.info("Starting agent with wallet: %s", test_wallet)
 speak_text(f"Starting agent with wallet: {test_wallet}")
-logger.info(f"Input: {user_input}")
-
-result = app.invoke(initial_state)
-
-print("\n" + "="*80)
-print("FINAL RESULT")
-print("="*80)
-print(f"Status: {result['status']}")
+logger.info("Input: %s", user_input)
+
+async def run_agent(state: AgentState, thread_id: str) -> AgentState:
+    """Run the graph, answering HUMAN_CONFIRM interrupts from stdin until it finishes"""
+    # Connection details (and the chain id cache) are only fetched once a run starts
+    await asyncio.to_thread(log_startup)
+    config = {"configurable": {"thread_id": thread_id}}
+    result = await app.ainvoke(state, config=config)
+    snapshot = await app.aget_state(config)
+    while snapshot.next:
+        pending = [i for task in snapshot.tasks for i in task.interrupts]
+        prompt = pending[0].value["prompt"] if pending else "Approve? (yes/no): "
+        await asyncio.to_thread(speak_flush)
+        answer = await asyncio.to_thread(input, prompt)
+        result = await app.ainvoke(Command(resume=answer), config=config)
+        snapshot = await app.aget_state(config)
+    return result
+
+result = asyncio.run(run_agent(initial_state, thread_id=initial_state["user_id"]))
+
+logger.info("\n" + "="*80)
+logger.info("FINAL RESULT")
+logger.info("="*80)
+logger.info("Status: %s", result['status'])
 if result.get('error'):
-    print(f"Error: {result['error']}")
+    logger.info("Error: %s", result['error'])
+elif result['status'] == "rejected":
+    logger.info("❌ Swap rejected at confirmation - nothing was built or sent")
 else:
-    print(f"✓ Agent completed successfully!")
-    print(f"\nIntent: {result['intent']}")
-    print(f"Price USD: ${result['price_usd']:,.2f}")
+    logger.info("✓ Agent completed successfully!")
+    logger.info("\nIntent: %s", result['intent'])
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("Price USD: $%s", format(result['price_usd'], ",.2f"))
     if result.get('swap_transaction'):
-        print(f"\nSwap transaction ready:")
+        logger.info("\nSwap transaction ready:")
         if IS_TESTING:
-            print(f"  Mode: TESTING (Uniswap V3)")
-            print(f"  Approval needed: Yes")
+            logger.info("  Mode: TESTING (Uniswap V3)")
+            logger.info("  Approval needed: Yes")
         else:
-            print(f"  Mode: PRODUCTION (1inch)")
-        print(f"  Ready for execution: Yes")
\ No newline at end of file
+            logger.info("  Mode: PRODUCTION (1inch)")
+        logger.info("  Ready for execution: Yes")
+
+# Let queued speech finish before the daemon TTS thread exits with the process
+speak_flush()
@@ -10,8 +10,16 @@ from requests.adapters import HTTPAdapter
 from langgraph.graph import StateGraph
 from urllib3.util.retry import Retry
 from dotenv import load_dotenv
-from web3 import Web3
+from eth_abi import decode, encode
+from eth_utils import keccak
+from web3 import Web3, AsyncWeb3, AsyncHTTPProvider, WebSocketProvider
+from web3.exceptions import TransactionNotFound
+from pathlib import Path
 import requests
+import orjson
+import aiohttp
+import asyncio
+import functools
 import logging
 import json
 import time
@@ -21,58 +29,154 @@ import whisper
 import sounddevice as sd
 import numpy as np
 import pyttsx3
-import tempfile
-import scipy.io.wavfile as wav
-import re
+import threading
+import queue
+
+try:
+    # Optional: better end-of-speech detection than the energy threshold below
+    import webrtcvad
+except ImportError:
+    webrtcvad = None
 
 warnings.filterwarnings("ignore", category=DeprecationWarning)
 
 load_dotenv()
 
+VAD_FRAME = 480  # 30 ms at 16 kHz, a frame size webrtcvad accepts
+SILENCE_TO_STOP = 0.8  # seconds of silence after speech that end the utterance
+ENERGY_THRESHOLD = 0.01  # RMS fallback when webrtcvad is not installed
+
 def record_audio(duration=5, samplerate=16000):
+    """Record until the speaker stops (or `duration` seconds at most)"""
+    buffer = np.empty(int(duration * samplerate), dtype=np.float32)
+    vad = webrtcvad.Vad(2) if webrtcvad else None
+    silent_frames_to_stop = int(SILENCE_TO_STOP * samplerate / VAD_FRAME)
+    done = threading.Event()
+    progress = {"filled": 0, "speech": False, "silent": 0}
+
+    def is_speech(frame):
+        if vad:
+            return vad.is_speech((frame * 32767).astype(np.int16).tobytes(), samplerate)
+        return float(np.sqrt(np.mean(frame * frame))) > ENERGY_THRESHOLD
+
+    def callback(indata, frames, time_info, status):
+        if done.is_set():
+            return
+        start = progress["filled"]
+        n = min(frames, len(buffer) - start)
+        frame = indata[:n, 0]
+        buffer[start:start + n] = frame
+        progress["filled"] = start + n
+
+        if is_speech(frame):
+            progress["speech"], progress["silent"] = True, 0
+        elif progress["speech"]:
+            progress["silent"] += 1
+
+        if progress["filled"] >= len(buffer) or progress["silent"] >= silent_frames_to_stop:
+            done.set()
+
     print("Speak now...")
-    audio = sd.rec(int(duration * samplerate), samplerate=samplerate, channels=1, dtype=np.float32)
-    sd.wait()
+    with sd.InputStream(samplerate=samplerate, channels=1, dtype='float32',
+                        blocksize=VAD_FRAME, callback=callback):
+        done.wait(timeout=duration + 1)
     print("Recording stopped.")
-    return np.squeeze(audio)
+    return buffer[:progress["filled"]]
 
-def whisper_transcribe(duration=5, model_name='base'):
-    model = whisper.load_model(model_name)
+@functools.lru_cache(maxsize=4)
+def _whisper(model_name='base'):
+    """Load Whisper weights once per model name"""
+    return whisper.load_model(model_name)
+
+def whisper_transcribe(duration=5, model_name='base', model=None):
+    model = model or _whisper(model_name)
+    speak_flush()  # don't record the agent's own voice
     audio_data = record_audio(duration)
-    with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tempf:
-        wav.write(tempf.name, 16000, (audio_data * 32767).astype(np.int16))
-        result = model.transcribe(tempf.name)
+    # Whisper takes 16 kHz float32 samples directly, no need to round-trip through a WAV file
+    result = model.transcribe(audio_data.astype(np.float32, copy=False))
     text = result["text"].strip()
     print(f"Whisper transcript: {text}")
     return text
 
-def speak_text(text):
-    clean_text = re.sub(r'[\\\*\`_\$\[\]\(\)]', '', str(text))  # strip markdown/math
+@functools.lru_cache(maxsize=1)
+def _tts_engine():
+    """Initialise the pyttsx3 engine once and reuse it for every utterance"""
     engine = pyttsx3.init()
     engine.setProperty('rate', 180)
     engine.setProperty('volume', 1.0)
-    engine.say(clean_text)
-    engine.runAndWait()
+    return engine
+
+# Markdown/math characters that should not be read out loud
+_MD_STRIP = str.maketrans('', '', '\\*`_$[]()')
+
+# Speech runs on its own thread so nodes don't wait for playback to finish
+_TTS_Q = queue.Queue()
+
+def _tts_worker():
+    # pyttsx3 engines must be driven from the thread that created them
+    engine = _tts_engine()
+    while True:
+        text = _TTS_Q.get()
+        try:
+            engine.say(text)
+            engine.runAndWait()
+        except Exception as e:
+            print(f"TTS failed: {e}")
+        finally:
+            _TTS_Q.task_done()
+
+threading.Thread(target=_tts_worker, daemon=True).start()
+
+def speak_text(text):
+    _TTS_Q.put(str(text).translate(_MD_STRIP))
+
+def speak_flush():
+    """Block until everything queued with speak_text has been spoken"""
+    _TTS_Q.join()
 
 # Cell 2: Load Environment
 load_dotenv()
 
 # Cell 3: Load Token Map
-with open("new_tokens_map.json") as f:
-    TOKEN_MAP = json.load(f)
+TOKEN_MAP = orjson.loads(Path("new_tokens_map.json").read_bytes())
 
 # Cell 4: Configuration
 IS_TESTING = False  # Always use Sepolia now
 
 # Sepolia Configuration
 SEPOLIA_RPC_URL = os.getenv("ALCHEMY_RPC_URL")  # Add to your .env
-w3 = Web3(Web3.HTTPProvider(SEPOLIA_RPC_URL))
+ALCHEMY_WS_URL = os.getenv("ALCHEMY_WS_URL")  # Optional wss:// endpoint for receipt notifications
+
+# Shared keep-alive session for web3, CoinGecko and raw JSON-RPC requests
+SESSION = requests.Session()
+SESSION.headers["Connection"] = "keep-alive"
+# Every JSON-RPC call is a POST, so POST has to be retryable for the 429/5xx retries to
+# cover RPC traffic at all. The only writes on this session are signed
+# eth_sendRawTransaction calls: a replay carries the same hash and nonce, so the node
+# drops it ("already known" / "nonce too low") instead of sending a second tx.
+# 500 is left out, since the node may already have acted on that request.
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=16,
+    max_retries=Retry(
+        total=3,
+        backoff_factor=0.2,
+        status_forcelist=[429, 502, 503, 504],
+        allowed_methods=["GET", "POST"],
+    )
+))
+
+w3 = Web3(Web3.HTTPProvider(SEPOLIA_RPC_URL, session=SESSION))
+aw3 = AsyncWeb3(AsyncHTTPProvider(SEPOLIA_RPC_URL))  # used by the async graph nodes
+# One aiohttp session for the whole agent run, shared by aw3 and CoinGecko (set in run_agent)
+_AIO_SESSION: Optional[aiohttp.ClientSession] = None
 
 # Your deployed contracts
 DASH_TOKEN = "0xA4e2553B97FCa8205a8ba108814016e43c9fd32a"
 SMS_TOKEN = "0x56C092A883032CE07Bb2b506eFf8EeEe85b444F8"
 LIQUIDITY_POOL = "0xE3f19EdE356F5E1C1Ef3499F80F794D2C9F3670a"
 DEPLOYER_ADDRESS = "0x34Df0107d4aEE3830899d2AC1F52ACd4015F729B"
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
 CHAIN_ID = 11155111
 
 # CoinGecko still needed for price discovery
@@ -85,6 +189,13 @@ print(f"Network: Sepolia")
 print(f"Pool Address: {LIQUIDITY_POOL}")
 
 ERC20_ABI = [
+    {
+        "constant": True,
+        "inputs": [],
+        "name": "symbol",
+        "outputs": [{"name": "", "type": "string"}],
+        "type": "function"
+    },
     {
         "constant": True,
         "inputs": [{"name": "_owner", "type": "address"}],
@@ -195,6 +306,64 @@ LIQUIDITY_POOL_ABI = [
     }
 ]
 
+# Cell 7.6: Multicall3 ABI (aggregate3 only)
+MULTICALL3_ABI = [
+    {
+        "type": "function",
+        "name": "aggregate3",
+        "inputs": [
+            {
+                "name": "calls",
+                "type": "tuple[]",
+                "components": [
+                    {"name": "target", "type": "address"},
+                    {"name": "allowFailure", "type": "bool"},
+                    {"name": "callData", "type": "bytes"}
+                ]
+            }
+        ],
+        "outputs": [
+            {
+                "name": "returnData",
+                "type": "tuple[]",
+                "components": [
+                    {"name": "success", "type": "bool"},
+                    {"name": "returnData", "type": "bytes"}
+                ]
+            }
+        ],
+        "stateMutability": "payable"
+    },
+    {
+        "type": "function",
+        "name": "getEthBalance",
+        "inputs": [{"name": "addr", "type": "address"}],
+        "outputs": [{"name": "balance", "type": "uint256"}],
+        "stateMutability": "view"
+    }
+]
+
+# Cell 7.7: Contract objects, built once and shared by every node
+@functools.lru_cache(maxsize=None)
+def erc20(token_address: str):
+    """ERC20 contract object for an address, created on first use"""
+    return w3.eth.contract(address=token_address, abi=ERC20_ABI)
+
+DASH_CONTRACT = erc20(DASH_TOKEN)
+SMS_CONTRACT = erc20(SMS_TOKEN)
+POOL_CONTRACT = w3.eth.contract(address=LIQUIDITY_POOL, abi=LIQUIDITY_POOL_ABI)
+ASYNC_POOL_CONTRACT = aw3.eth.contract(address=LIQUIDITY_POOL, abi=LIQUIDITY_POOL_ABI)
+MULTICALL3_CONTRACT = w3.eth.contract(address=MULTICALL3_ADDRESS, abi=MULTICALL3_ABI)
+
+# Cell 7.8: Function selectors for the transactions the agent sends
+TRANSFER_SELECTOR = keccak(text="transfer(address,uint256)")[:4]
+APPROVE_SELECTOR = keccak(text="approve(address,uint256)")[:4]
+SWAP_SELECTOR = keccak(text="swap(uint256,uint256,uint256)")[:4]
+
+def call_data(selector: bytes, types: List[str], args: list) -> str:
+    """Calldata for a known selector, encoded without going through the contract ABI"""
+    return "0x" + (selector + encode(types, args)).hex()
+
 # Cell 8: Initialize LLM
 llm = ChatGoogleGenerativeAI(model="gemini-2.5-pro")
 
@@ -242,11 +411,24 @@ class Info(BaseModel):
 # Cell 12: Helper Functions
 getcontext().prec = 60
 
+# 10**decimals for every decimals value a uint256 amount can use
+SCALE = {d: 10 ** d for d in range(78)}
+
 def resolve_amount_to_base(amount: "float|str|Decimal", decimals: int) -> int:
-    """Convert human amount to integer base units using Decimal."""
+    """Convert human amount to integer base units (rounded down)."""
     if decimals < 0:
         raise ValueError("decimals must be non-negative")
-    
+
+    # Fast path: plain "123.456" strings/numbers are split and scaled with integer math
+    if isinstance(amount, (str, int, float)) and not isinstance(amount, bool):
+        int_part, _, frac = str(amount).strip().partition(".")
+        if (int_part or frac) and (not int_part or int_part.isdigit()) and (not frac or frac.isdigit()):
+            if not (int_part + frac).strip("0"):
+                raise ValueError("amount must be > 0")
+            frac = (frac + "0" * decimals)[:decimals]
+            return int(int_part or 0) * SCALE[decimals] + int(frac or 0)
+
+    # Exponents, signs, Decimal inputs etc. go through Decimal for validation
     if isinstance(amount, Decimal):
         dec_amt = amount
     else:
@@ -262,12 +444,192 @@ def resolve_amount_to_base(amount: "float|str|Decimal", decimals: int) -> int:
     base = (dec_amt * scale).to_integral_value(rounding="ROUND_DOWN")
     return int(base)
 
-def get_token_balance(token_address: str, holder_address: str) -> float:
-    """Get token balance for an address"""
-    token = w3.eth.contract(address=token_address, abi=ERC20_ABI)
-    balance = token.functions.balanceOf(holder_address).call()
-    decimals = token.functions.decimals().call()
-    return balance / (10 ** decimals)
+# (symbol, decimals) for every token we already know about, keyed by lowercase address
+TOKEN_META = {t["address"].lower(): (t["symbol"], t["decimals"]) for t in TOKEN_MAP.values()}
+
+@functools.lru_cache(maxsize=64)
+def _token_meta(token_address: str) -> tuple:
+    """(symbol, decimals) from TOKEN_MAP when known, otherwise both read in one Multicall3 call"""
+    known = TOKEN_META.get(token_address.lower())
+    if known is not None:
+        return known
+    token = erc20(token_address)
+    symbol_raw, decimals_raw = multicall3([
+        (token_address, token.encode_abi("symbol")),
+        (token_address, token.encode_abi("decimals")),
+    ])
+    return decode(["string"], symbol_raw)[0], decode(["uint8"], decimals_raw)[0]
+
+def _decimals(token_address: str) -> int:
+    return _token_meta(token_address)[1]
+
+def rpc_batch(calls: List[tuple]) -> List[Any]:
+    """Send several JSON-RPC calls in one HTTP request, results returned in call order"""
+    payload = [
+        {"jsonrpc": "2.0", "id": i, "method": method, "params": params}
+        for i, (method, params) in enumerate(calls)
+    ]
+    resp = SESSION.post(SEPOLIA_RPC_URL, data=orjson.dumps(payload),
+                        headers={"Content-Type": "application/json"}, timeout=10)
+    resp.raise_for_status()
+    body = orjson.loads(resp.content)
+    if isinstance(body, dict):
+        raise ValueError(f"RPC batch rejected: {body.get('error')}")
+
+    # Batch responses are not guaranteed to keep request order, match them by id
+    by_id = {item.get("id"): item for item in body}
+    results = []
+    for i, (method, _) in enumerate(calls):
+        item = by_id.get(i)
+        if item is None or "error" in item:
+            raise ValueError(f"RPC {method} failed: {item.get('error') if item else 'no response'}")
+        results.append(item["result"])
+    return results
+
+def eip1559_fees(fee_history: dict) -> dict:
+    """EIP-1559 fee fields from an eth_feeHistory result (10/50/90th percentile rewards)"""
+    # baseFeePerGas has one extra entry: the base fee of the next block
+    base_fee = int(fee_history["baseFeePerGas"][-1], 16)
+    tips = sorted(int(reward[1], 16) for reward in fee_history["reward"])
+    priority_fee = tips[len(tips) // 2] if tips else w3.to_wei(1, "gwei")
+    return {
+        'maxFeePerGas': 2 * base_fee + priority_fee,
+        'maxPriorityFeePerGas': priority_fee,
+        'type': 2,
+    }
+
+def tx_snapshot(address: str) -> tuple:
+    """EIP-1559 fees and next nonce for an address, fetched in one batched round trip"""
+    fee_history, nonce = rpc_batch([
+        ("eth_feeHistory", [5, "latest", [10, 50, 90]]),
+        ("eth_getTransactionCount", [address, "latest"]),
+    ])
+    return eip1559_fees(fee_history), int(nonce, 16)
+
+def decode_result(types: List[str], raw: str) -> tuple:
+    """ABI-decode the hex result of an eth_call"""
+    return decode(types, Web3.to_bytes(hexstr=raw))
+
+def swap_preflight(token_address: str, address: str) -> tuple:
+    """Token balance (base units), EIP-1559 fees and nonce in a single batched round trip"""
+    balance_raw, fee_history, nonce, chain_id = rpc_batch([
+        ("eth_call", [{"to": token_address, "data": erc20(token_address).encode_abi("balanceOf", args=[address])}, "latest"]),
+        ("eth_feeHistory", [5, "latest", [10, 50, 90]]),
+        ("eth_getTransactionCount", [address, "latest"]),
+        ("eth_chainId", []),
+    ])
+    if int(chain_id, 16) != CHAIN_ID:
+        raise ValueError(f"RPC is on chain {int(chain_id, 16)}, expected {CHAIN_ID}")
+    balance, = decode_result(["uint256"], balance_raw)
+    return balance, eip1559_fees(fee_history), int(nonce, 16)
+
+def simulate_swap(from_addr: str, calls: List[tuple], out_token: str) -> Optional[int]:
+    """Dry-run (to, data) calls with eth_simulateV1 and return how much out_token they deliver.
+
+    Returns None if the RPC does not support simulation; raises ValueError if a call reverts.
+    """
+    balance_call = {"from": from_addr, "to": out_token, "data": erc20(out_token).encode_abi("balanceOf", args=[from_addr])}
+    sim_calls = [balance_call] + [{"from": from_addr, "to": to, "data": data} for to, data in calls] + [balance_call]
+    try:
+        blocks, = rpc_batch([
+            ("eth_simulateV1", [{"blockStateCalls": [{"calls": sim_calls}], "validation": False}, "latest"]),
+        ])
+    except (ValueError, requests.RequestException) as e:
+        logger.warning(f"Swap simulation unavailable: {e}")
+        return None
+
+    results = blocks[0]["calls"]
+    for call, result in zip(sim_calls, results):
+        if result.get("status") != "0x1":
+            reason = (result.get("error") or {}).get("message", "unknown reason")
+            raise ValueError(f"Simulated call to {call['to']} reverted: {reason}")
+    before, = decode_result(["uint256"], results[0]["returnData"])
+    after, = decode_result(["uint256"], results[-1]["returnData"])
+    return after - before
+
+def multicall3(calls: List[tuple]) -> List[bytes]:
+    """Run several (target, calldata) reads in a single eth_call through Multicall3"""
+    results = MULTICALL3_CONTRACT.functions.aggregate3(
+        [(target, False, data) for target, data in calls]
+    ).call()
+    return [return_data for _success, return_data in results]
+
+# Pseudo token for native ETH in get_token_balances
+NATIVE_ETH = "ETH"
+
+def get_token_balances(tokens: List[str], wallet: str) -> Dict[str, float]:
+    """Balances of several tokens (and NATIVE_ETH) for one wallet in a single Multicall3 read"""
+    calls = [
+        (MULTICALL3_ADDRESS, MULTICALL3_CONTRACT.encode_abi("getEthBalance", args=[wallet]))
+        if token == NATIVE_ETH else
+        (token, erc20(token).encode_abi("balanceOf", args=[wallet]))
+        for token in tokens
+    ]
+    balances = {}
+    for token, raw in zip(tokens, multicall3(calls)):
+        decimals = 18 if token == NATIVE_ETH else _decimals(token)
+        balances[token] = decode(["uint256"], raw)[0] / SCALE[decimals]
+    return balances
+
+@functools.lru_cache(maxsize=None)
+def _pool_tokens() -> tuple:
+    """token0/token1 of the pool; immutable, so read once per process"""
+    token0_raw, token1_raw = multicall3([
+        (LIQUIDITY_POOL, POOL_CONTRACT.encode_abi("token0")),
+        (LIQUIDITY_POOL, POOL_CONTRACT.encode_abi("token1")),
+    ])
+    token0 = Web3.to_checksum_address(decode(["address"], token0_raw)[0])
+    token1 = Web3.to_checksum_address(decode(["address"], token1_raw)[0])
+    return token0, token1
+
+def get_amount_out(amount_in: int, reserve_in: int, reserve_out: int) -> int:
+    """Local copy of MinimalLiquidityPool.getAmountOut (constant product, 0.3% fee)"""
+    if amount_in <= 0:
+        raise ValueError("Invalid input amount")
+    if reserve_in <= 0 or reserve_out <= 0:
+        raise ValueError("Invalid reserves")
+    amount_in_with_fee = amount_in * 997
+    return (amount_in_with_fee * reserve_out) // (reserve_in * 1000 + amount_in_with_fee)
+
+_ws_w3 = None
+
+async def _ws_connection():
+    """Open the websocket connection on first use and keep it for the rest of the run"""
+    global _ws_w3
+    if _ws_w3 is None:
+        _ws_w3 = await AsyncWeb3(WebSocketProvider(ALCHEMY_WS_URL))
+    return _ws_w3
+
+async def close_ws_connection():
+    global _ws_w3
+    if _ws_w3 is not None:
+        await _ws_w3.provider.disconnect()
+        _ws_w3 = None
+
+async def await_receipt_ws(tx_hash, timeout: float = 120):
+    """Wait for a receipt by checking once per new block (newHeads) instead of polling"""
+    if not ALCHEMY_WS_URL:
+        return await aw3.eth.wait_for_transaction_receipt(tx_hash, timeout=timeout)
+
+    ws = await _ws_connection()
+
+    async def _wait():
+        sub_id = await ws.eth.subscribe("newHeads")
+        try:
+            # The tx may already be mined before the next head arrives
+            try:
+                return await ws.eth.get_transaction_receipt(tx_hash)
+            except TransactionNotFound:
+                pass
+            async for _head in ws.socket.process_subscriptions():
+                try:
+                    return await ws.eth.get_transaction_receipt(tx_hash)
+                except TransactionNotFound:
+                    continue
+        finally:
+            await ws.eth.unsubscribe(sub_id)
+
+    return await asyncio.wait_for(_wait(), timeout)
 
 # Cell 12.5: Faucet Helper
 def mint_test_tokens(wallet_address: str, amount_dash: float = 1000, amount_sms: float = 1000):
@@ -284,8 +646,11 @@ def mint_test_tokens(wallet_address: str, amount_dash: float = 1000, amount_sms:
     account = w3.eth.account.from_key(private_key)
     
     try:
+        # One snapshot for both transfers; the nonce is bumped locally after each send
+        fees, nonce = tx_snapshot(account.address)
+        deployer_balances = get_token_balances([DASH_TOKEN, SMS_TOKEN], DEPLOYER_ADDRESS)
+        
         # Mint DASH tokens
-        dash_contract = w3.eth.contract(address=DASH_TOKEN, abi=ERC20_ABI)
         dash_amount_base = resolve_amount_to_base(amount_dash, 18)
         
         # Check if there's a mint function (you may need to add this to your contract)
@@ -294,26 +659,24 @@ def mint_test_tokens(wallet_address: str, amount_dash: float = 1000, amount_sms:
         logger.info(f"Attempting to get {amount_dash} DASH for {wallet_address}")
         
         # Check deployer's DASH balance
-        deployer_dash = get_token_balance(DASH_TOKEN, DEPLOYER_ADDRESS)
+        deployer_dash = deployer_balances[DASH_TOKEN]
         logger.info(f"Deployer DASH balance: {deployer_dash:.2f}")
         
         if deployer_dash >= amount_dash:
             # Transfer from deployer
-            nonce = w3.eth.get_transaction_count(account.address)
-            
-            transfer_tx = dash_contract.functions.transfer(
-                wallet_address,
-                dash_amount_base
-            ).build_transaction({
-                'from': account.address,
+            transfer_tx = {
+                'to': DASH_TOKEN,
+                'data': call_data(TRANSFER_SELECTOR, ['address', 'uint256'], [wallet_address, dash_amount_base]),
                 'gas': 100000,
-                'gasPrice': w3.eth.gas_price,
+                **fees,
                 'nonce': nonce,
-                'chainId': CHAIN_ID
-            })
+                'chainId': CHAIN_ID,
+                'value': 0
+            }
             
             signed_tx = account.sign_transaction(transfer_tx)
             tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+            nonce += 1
             receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
             
             if receipt['status'] == 1:
@@ -324,28 +687,25 @@ def mint_test_tokens(wallet_address: str, amount_dash: float = 1000, amount_sms:
                 return False
         
         # Mint SMS tokens (same logic)
-        sms_contract = w3.eth.contract(address=SMS_TOKEN, abi=ERC20_ABI)
         sms_amount_base = resolve_amount_to_base(amount_sms, 18)
         
-        deployer_sms = get_token_balance(SMS_TOKEN, DEPLOYER_ADDRESS)
+        deployer_sms = deployer_balances[SMS_TOKEN]
         logger.info(f"Deployer SMS balance: {deployer_sms:.2f}")
         
         if deployer_sms >= amount_sms:
-            nonce = w3.eth.get_transaction_count(account.address)
-            
-            transfer_tx = sms_contract.functions.transfer(
-                wallet_address,
-                sms_amount_base
-            ).build_transaction({
-                'from': account.address,
+            transfer_tx = {
+                'to': SMS_TOKEN,
+                'data': call_data(TRANSFER_SELECTOR, ['address', 'uint256'], [wallet_address, sms_amount_base]),
                 'gas': 100000,
-                'gasPrice': w3.eth.gas_price,
+                **fees,
                 'nonce': nonce,
-                'chainId': CHAIN_ID
-            })
+                'chainId': CHAIN_ID,
+                'value': 0
+            }
             
             signed_tx = account.sign_transaction(transfer_tx)
             tx_hash = w3.eth.send_raw_transaction(signed_tx.raw_transaction)
+            nonce += 1
             receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
             
             if receipt['status'] == 1:
@@ -365,65 +725,70 @@ def mint_test_tokens(wallet_address: str, amount_dash: float = 1000, amount_sms:
         return False
 
 # Cell 13: Node 1 - Intent Interpretation (FIXED)
-def node_interpret_intent(state: AgentState) -> AgentState:
+# The model fills the Info schema directly, so there is no JSON to parse or re-validate
+intent_llm = llm.with_structured_output(Info)
+
+INTENT_SYSTEM_PROMPT = (
+    "You are a helper that MUST output strictly valid JSON matching this schema: "
+    "{action, asset_in, asset_out, amount}. "
+    "Fields:\n"
+    "- action: one of \"swap\", \"buy\", \"sell\"\n"
+    "- asset_in: token symbol or contract address\n"
+    "- asset_out: token symbol or contract address\n"
+    "- amount: numeric (float), positive\n\n"
+    "Return only the JSON object."
+)
+
+INTENT_EXAMPLES = [
+    {"user": "Swap $200 of USDC to ETH", "assistant": {"action":"swap","asset_in":"USDC","asset_out":"ETH","amount":200}},
+    {"user": "buy 0.1 ETH with USDC", "assistant": {"action":"buy","asset_in":"USDC","asset_out":"ETH","amount":0.1}},
+    {"user": "sell 10 DAI for USDC", "assistant": {"action":"sell","asset_in":"DAI","asset_out":"USDC","amount":10}}
+]
+
+# System prompt + few-shot examples are identical for every request, so the
+# message prefix is built once (and stays byte-identical for Gemini prefix caching)
+_INTENT_PROMPT_PREFIX = [("system", INTENT_SYSTEM_PROMPT)] + [
+    pair
+    for ex in INTENT_EXAMPLES
+    for pair in (("user", ex["user"]), ("assistant", json.dumps(ex["assistant"])))
+]
+
+async def node_interpret_intent(state: AgentState) -> AgentState:
     """Parse user input into structured intent using LLM"""
     logger.info(f"\n{'='*60}")
     logger.info(f"NODE 1: INTERPRET INTENT")
-    speak_text("NODE 1: INTERPRET INTENT")
     logger.info(f"{'='*60}")
     logger.info(f"User input: {state['user_input']}")
-    speak_text(f"User input: {state['user_input']}")
-    
-    system_prompt = (
-        "You are a helper that MUST output strictly valid JSON matching this schema: "
-        "{action, asset_in, asset_out, amount}. "
-        "Fields:\n"
-        "- action: one of \"swap\", \"buy\", \"sell\"\n"
-        "- asset_in: token symbol or contract address\n"
-        "- asset_out: token symbol or contract address\n"
-        "- amount: numeric (float), positive\n\n"
-        "Return only the JSON object."
-    )
-
-    examples = [
-        {"user": "Swap $200 of USDC to ETH", "assistant": {"action":"swap","asset_in":"USDC","asset_out":"ETH","amount":200}},
-        {"user": "buy 0.1 ETH with USDC", "assistant": {"action":"buy","asset_in":"USDC","asset_out":"ETH","amount":0.1}},
-        {"user": "sell 10 DAI for USDC", "assistant": {"action":"sell","asset_in":"DAI","asset_out":"USDC","amount":10}}
-    ]
-
-    messages = [("system", system_prompt)]
-    for ex in examples:
-        messages.append(("user", ex["user"]))
-        messages.append(("assistant", json.dumps(ex["assistant"])))
-        
-    resp = llm.invoke(messages+[("user", state["user_input"])])
+    speak_text(f"NODE 1: INTERPRET INTENT. User input: {state['user_input']}")
     
     try:
-        parsed = json.loads(resp.content)
-        logger.info(f"LLM raw response: {parsed}")
-    except Exception as e:
-        logger.error(f"Could not parse JSON from LLM: {e}")
-        state["error"] = "Could not parse JSON from LLM"
-        state["status"] = "failed"
-        return state  # ✅ FIX: Return state, not dict
-
-    try:
-        info = Info.model_validate(parsed)
-        logger.info(f"✓ Intent parsed successfully:")
-        logger.info(f"  Action: {info.action}")
-        logger.info(f"  Asset In: {info.asset_in}")
-        logger.info(f"  Asset Out: {info.asset_out}")
-        logger.info(f"  Amount: {info.amount}")
-        speak_text(f"Intent parsed successfully:")
-        speak_text(f"Action: {info.action}")
-        speak_text(f"Asset In: {info.asset_in}")
-        speak_text(f"Asset Out: {info.asset_out}")
-        speak_text(f"Amount: {info.amount}")
+        info = await intent_llm.ainvoke(_INTENT_PROMPT_PREFIX + [("user", state["user_input"])])
+        if info is None:
+            raise ValueError("LLM returned no structured output")
+        logger.info(f"LLM structured response: {info}")
     except ValidationError as e:
         logger.error(f"Validation failed: {e}")
         state["error"] = f"Validation failed: {e}"
         state["status"] = "failed"
         return state  # ✅ FIX: Return state, not dict
+    except Exception as e:
+        logger.error(f"Could not get intent from LLM: {e}")
+        state["error"] = "Could not get intent from LLM"
+        state["status"] = "failed"
+        return state  # ✅ FIX: Return state, not dict
+
+    logger.info(f"✓ Intent parsed successfully:")
+    logger.info(f"  Action: {info.action}")
+    logger.info(f"  Asset In: {info.asset_in}")
+    logger.info(f"  Asset Out: {info.asset_out}")
+    logger.info(f"  Amount: {info.amount}")
+    speak_text(". ".join([
+        "Intent parsed successfully",
+        f"Action: {info.action}",
+        f"Asset In: {info.asset_in}",
+        f"Asset Out: {info.asset_out}",
+        f"Amount: {info.amount}",
+    ]))
 
     # ✅ FIX: Update state directly
     state["intent"] = info.model_dump()
@@ -444,50 +809,104 @@ SYMBOL_TO_ID = {
     "DAI": "dai"
 }
 
-def get_price_usd(token_symbol: str) -> float:
+# Full CoinGecko symbol -> id map, kept on disk so restarts skip the multi-MB /coins/list download
+COINGECKO_SYMBOLS_CACHE = os.path.expanduser("~/.cache/coingecko_symbols.json")
+COINGECKO_SYMBOLS_MAX_AGE = 7 * 24 * 3600  # refresh weekly
+_coingecko_symbols_refreshed = False
+
+def _load_coingecko_symbols() -> Dict[str, str]:
+    """Read the cached symbol map, or an empty one if it is missing or stale"""
+    try:
+        if time.time() - os.path.getmtime(COINGECKO_SYMBOLS_CACHE) > COINGECKO_SYMBOLS_MAX_AGE:
+            return {}
+        symbols = orjson.loads(Path(COINGECKO_SYMBOLS_CACHE).read_bytes())
+    except (OSError, ValueError):
+        return {}
+    return symbols if isinstance(symbols, dict) else {}
+
+def _refresh_coingecko_symbols() -> None:
+    """Download /coins/list once, index it by symbol and write it to the disk cache"""
+    global _coingecko_symbols_refreshed
+    resp = SESSION.get(f"{COINGECKO_API_URL}/coins/list", timeout=10)
+    resp.raise_for_status()
+    all_coins = orjson.loads(resp.content)
+    # Rate-limit / error bodies are JSON objects; never cache those for a week
+    if not isinstance(all_coins, list):
+        raise ValueError(f"Unexpected /coins/list response: {str(all_coins)[:200]}")
+    symbols = {}
+    for c in all_coins:
+        symbols.setdefault(c["symbol"].upper(), c["id"])  # first match wins, like the old scan
+    os.makedirs(os.path.dirname(COINGECKO_SYMBOLS_CACHE), exist_ok=True)
+    Path(COINGECKO_SYMBOLS_CACHE).write_bytes(orjson.dumps(symbols))
+    for sym, coin_id in symbols.items():
+        SYMBOL_TO_ID.setdefault(sym, coin_id)
+    _coingecko_symbols_refreshed = True
+
+# Hand-picked ids above take precedence over the bulk list
+SYMBOL_TO_ID = {**_load_coingecko_symbols(), **SYMBOL_TO_ID}
+
+def resolve_coingecko_id(token_symbol: str) -> str:
     token_symbol = token_symbol.upper()
     token_id = SYMBOL_TO_ID.get(token_symbol)
 
+    if token_id is None and not _coingecko_symbols_refreshed:
+        _refresh_coingecko_symbols()
+        token_id = SYMBOL_TO_ID.get(token_symbol)
     if token_id is None:
-        all_coins = requests.get(f"{COINGECKO_API_URL}/coins/list", timeout=10).json()
-        for c in all_coins:
-            if c["symbol"].lower() == token_symbol.lower():
-                token_id = c["id"]
-                SYMBOL_TO_ID[token_symbol] = token_id
-                break
-        if token_id is None:
-            raise ValueError(f"Token symbol '{token_symbol}' not found on CoinGecko")
+        raise ValueError(f"Token symbol '{token_symbol}' not found on CoinGecko")
+    return token_id
 
+def get_price_usd(token_symbol: str) -> float:
+    token_id = resolve_coingecko_id(token_symbol)
     params = {"ids": token_id, "vs_currencies": "usd"}
     headers = {"x-cg-demo-api-key": COINGECKO_API_KEY}
-    resp = requests.get(f"{COINGECKO_API_URL}/simple/price", 
+    resp = SESSION.get(f"{COINGECKO_API_URL}/simple/price", 
                        params=params, headers=headers, timeout=10)
     resp.raise_for_status()
     data = resp.json()
     return float(data[token_id]["usd"])
 
+async def get_price_usd_async(session: aiohttp.ClientSession, token_symbol: str) -> float:
+    """Same lookup as get_price_usd, over aiohttp so it can overlap with RPC work"""
+    token_id = SYMBOL_TO_ID.get(token_symbol.upper())
+    if token_id is None:
+        # Rare cold miss: the /coins/list scan is blocking, keep it off the event loop
+        token_id = await asyncio.to_thread(resolve_coingecko_id, token_symbol)
+
+    params = {"ids": token_id, "vs_currencies": "usd"}
+    headers = {"x-cg-demo-api-key": COINGECKO_API_KEY}
+    async with session.get(f"{COINGECKO_API_URL}/simple/price", params=params,
+                           headers=headers, timeout=aiohttp.ClientTimeout(total=10)) as resp:
+        resp.raise_for_status()
+        data = await resp.json()
+    return float(data[token_id]["usd"])
+
 # Cell 14: Node 2 - Price Fetch (FIXED)
-def node_price_fetch(state: AgentState) -> AgentState:
+async def node_price_fetch(state: AgentState) -> AgentState:
     """Fetch USD price for the asset"""
     logger.info(f"\n{'='*60}")
     logger.info(f"NODE 2: PRICE FETCH")
-    speak_text(f"NODE 2: PRICE FETCH")
     logger.info(f"{'='*60}")
     
     asset = state["intent"]["asset_in"]
     logger.info(f"Fetching price for: {asset}")
-    speak_text(f"Fetching price for: {asset}")
     
     try:
-        price = get_price_usd(asset)
+        if _AIO_SESSION is not None:
+            price = await get_price_usd_async(_AIO_SESSION, asset)
+        else:
+            async with aiohttp.ClientSession() as session:
+                price = await get_price_usd_async(session, asset)
         total_usd = price * float(state["intent"]["amount"])
         
         logger.info(f"✓ Price fetched:")
         logger.info(f"  {asset} price: ${price:,.2f}")
         logger.info(f"  Total value: ${total_usd:,.2f}")
-        speak_text("Price fetched:")
-        speak_text(f"{asset} price: ${price:,.2f}")
-        speak_text(f"Total value: ${total_usd:,.2f}")
+        speak_text(". ".join([
+            "NODE 2: PRICE FETCH",
+            f"{asset} price: ${price:,.2f}",
+            f"Total value: ${total_usd:,.2f}",
+        ]))
         
         # ✅ FIX: Update state directly
         state["price_usd"] = total_usd
@@ -501,11 +920,10 @@ def node_price_fetch(state: AgentState) -> AgentState:
         return state
 
 # Cell 15: Node 3 - Quote Fetch (CORRECTED)
-def node_quote_fetch(state: AgentState) -> AgentState:
+async def node_quote_fetch(state: AgentState) -> AgentState:
     """Get swap quote from liquidity pool"""
     logger.info(f"\n{'='*60}")
     logger.info(f"NODE 3: QUOTE FETCH")
-    speak_text("NODE 3: QUOTE FETCH")
     logger.info(f"{'='*60}")
     
     try:
@@ -532,17 +950,13 @@ def node_quote_fetch(state: AgentState) -> AgentState:
         logger.info(f"  From: {a_in} ({from_token['address']})")
         logger.info(f"  To: {a_out} ({to_token['address']})")
         logger.info(f"  Amount: {amount} {a_in}")
-        speak_text(f"Querying pool for quote")
         
-        # Get pool contract
-        pool_contract = w3.eth.contract(address=LIQUIDITY_POOL, abi=LIQUIDITY_POOL_ABI)
-        
-        # Determine which token is token0 and token1
-        token0_addr = pool_contract.functions.token0().call()
-        token1_addr = pool_contract.functions.token1().call()
-        
-        # Get reserves
-        reserve0, reserve1 = pool_contract.functions.getReserves().call()
+        # Token order never changes (cached after the first read), only the reserves need a
+        # fresh read; on a cold cache both reads overlap
+        (token0_addr, token1_addr), (reserve0, reserve1) = await asyncio.gather(
+            asyncio.to_thread(_pool_tokens),
+            ASYNC_POOL_CONTRACT.functions.getReserves().call(),
+        )
         
         logger.info(f"Pool info:")
         logger.info(f"  Token0: {token0_addr}")
@@ -566,14 +980,10 @@ def node_quote_fetch(state: AgentState) -> AgentState:
             state["error"] = f"Token {a_in} not found in pool"
             return state
         
-        # Calculate expected output using the pool's formula
-        amount_out_base = pool_contract.functions.getAmountOut(
-            amount_base,
-            reserve_in,
-            reserve_out
-        ).call()
+        # Calculate expected output using the pool's formula (pure, so no RPC needed)
+        amount_out_base = get_amount_out(amount_base, reserve_in, reserve_out)
         
-        amount_out = amount_out_base / (10 ** to_token["decimals"])
+        amount_out = amount_out_base / SCALE[to_token["decimals"]]
         
         quote = {
             "fromToken": from_token,
@@ -592,7 +1002,7 @@ def node_quote_fetch(state: AgentState) -> AgentState:
         logger.info(f"  Output: {amount_out:.6f} {a_out}")
         logger.info(f"  Rate: 1 {a_in} = {amount_out/amount:.6f} {a_out}")
         logger.info(f"  Direction: {'token0→token1' if is_token0_to_token1 else 'token1→token0'}")
-        speak_text(f"Quote received: {amount_out:.6f} {a_out}")
+        speak_text(f"NODE 3: QUOTE FETCH. Quote received: {amount_out:.6f} {a_out}")
         
         state["quote"] = quote
         state["status"] = "quote_ready"
@@ -606,12 +1016,20 @@ def node_quote_fetch(state: AgentState) -> AgentState:
         state["error"] = str(e)
         return state
 
+# Cell 15.5: Price + Quote, fetched concurrently
+async def node_market_fetch(state: AgentState) -> AgentState:
+    """Run the CoinGecko price fetch and the pool quote at the same time"""
+    # Each node fills in its own keys; a failure in either one marks the whole step failed
+    await asyncio.gather(node_price_fetch(state), node_quote_fetch(state))
+    if state.get("error"):
+        state["status"] = "failed"
+    return state
+
 # Cell 16: Node 4 - Build Swap (CORRECTED)
-def node_build_swap(state: AgentState) -> AgentState:
+async def node_build_swap(state: AgentState) -> AgentState:
     """Build swap transaction for liquidity pool"""
     logger.info(f"\n{'='*60}")
     logger.info(f"NODE 4: BUILD SWAP")
-    speak_text("NODE 4: BUILD SWAP")
     logger.info(f"{'='*60}")
     
     try:
@@ -643,11 +1061,39 @@ def node_build_swap(state: AgentState) -> AgentState:
         logger.info(f"  From: {from_addr}")
         logger.info(f"  Direction: {'token0→token1' if is_token0_to_token1 else 'token1→token0'}")
         
-        # Check balance
-        current_balance = get_token_balance(from_token["address"], from_addr)
-        required_amount = amount_base / (10 ** from_token["decimals"])
+        # swap(amount0In, amount1In, minAmountOut)
+        # If swapping token0→token1: amount0In = amount, amount1In = 0
+        # If swapping token1→token0: amount0In = 0, amount1In = amount
+        
+        if is_token0_to_token1:
+            # Swapping token0 for token1
+            amount0_in = amount_base
+            amount1_in = 0
+        else:
+            # Swapping token1 for token0
+            amount0_in = 0
+            amount1_in = amount_base
+        
+        approve_data = call_data(APPROVE_SELECTOR, ['address', 'uint256'], [LIQUIDITY_POOL, amount_base])
+        swap_data = call_data(SWAP_SELECTOR, ['uint256', 'uint256', 'uint256'], [amount0_in, amount1_in, min_amount_out])
+        
+        # Balance/fees/nonce and a dry run of approve + swap, side by side
+        preflight, simulated_out = await asyncio.gather(
+            asyncio.to_thread(swap_preflight, from_token["address"], from_addr),
+            asyncio.to_thread(
+                simulate_swap, from_addr,
+                [(from_token["address"], approve_data), (LIQUIDITY_POOL, swap_data)],
+                to_token["address"],
+            ),
+            return_exceptions=True,
+        )
+        if isinstance(preflight, Exception):
+            raise preflight
+        balance_base, fees, nonce = preflight
+        current_balance = balance_base / SCALE[from_token["decimals"]]
+        required_amount = amount_base / SCALE[from_token["decimals"]]
         
-        if current_balance < required_amount:
+        if balance_base < amount_base:
             state["status"] = "failed"
             state["error"] = f"Insufficient balance: have {current_balance:.6f}, need {required_amount:.6f}"
             logger.error(f"❌ Insufficient balance: have {current_balance:.6f}, need {required_amount:.6f}")
@@ -655,53 +1101,34 @@ def node_build_swap(state: AgentState) -> AgentState:
         
         logger.info(f"✓ Sufficient balance: {current_balance:.6f} {a_in}")
         
-        # Build approval transaction
-        token_contract = w3.eth.contract(address=from_token["address"], abi=ERC20_ABI)
-        
-        # Get current nonce
-        nonce = w3.eth.get_transaction_count(from_addr)
+        if isinstance(simulated_out, Exception):
+            raise simulated_out
+        if simulated_out is not None:
+            logger.info(f"✓ Simulation: swap delivers {simulated_out / SCALE[to_token['decimals']]:.6f} {a_out}")
         
-        approve_tx = token_contract.functions.approve(
-            LIQUIDITY_POOL,
-            amount_base
-        ).build_transaction({
-            'from': from_addr,
+        # Build approval transaction
+        approve_tx = {
+            'to': from_token["address"],
+            'data': approve_data,
             'gas': 100000,
-            'gasPrice': w3.eth.gas_price,
+            **fees,
             'nonce': nonce,
-            'chainId': CHAIN_ID
-        })
+            'chainId': CHAIN_ID,
+            'value': 0
+        }
         
         logger.info(f"✓ Approval transaction built (nonce: {nonce})")
         
         # Build swap transaction
-        # swap(amount0In, amount1In, minAmountOut)
-        # If swapping token0→token1: amount0In = amount, amount1In = 0
-        # If swapping token1→token0: amount0In = 0, amount1In = amount
-        
-        pool_contract = w3.eth.contract(address=LIQUIDITY_POOL, abi=LIQUIDITY_POOL_ABI)
-        
-        if is_token0_to_token1:
-            # Swapping token0 for token1
-            amount0_in = amount_base
-            amount1_in = 0
-        else:
-            # Swapping token1 for token0
-            amount0_in = 0
-            amount1_in = amount_base
-        
-        swap_tx = pool_contract.functions.swap(
-            amount0_in,
-            amount1_in,
-            min_amount_out
-        ).build_transaction({
-            'from': from_addr,
+        swap_tx = {
+            'to': LIQUIDITY_POOL,
+            'data': swap_data,
             'gas': 200000,
-            'gasPrice': w3.eth.gas_price,
+            **fees,
             'nonce': nonce + 1,  # Incremented nonce
             'chainId': CHAIN_ID,
             'value': 0
-        })
+        }
         
         logger.info(f"✓ Swap transaction built:")
         logger.info(f"  amount0In: {amount0_in}")
@@ -709,7 +1136,7 @@ def node_build_swap(state: AgentState) -> AgentState:
         logger.info(f"  minAmountOut: {min_amount_out}")
         logger.info(f"  Gas estimate: {swap_tx['gas']}")
         logger.info(f"  Nonce: {nonce + 1}")
-        speak_text("Swap transaction ready")
+        speak_text("NODE 4: BUILD SWAP. Swap transaction ready")
         
         state["swap_transaction"] = {
             "approval_tx": approve_tx,
@@ -744,7 +1171,7 @@ def node_decide(state: AgentState) -> AgentState:
     
     return state
 
-def node_human_confirm(state: AgentState) -> AgentState:
+async def node_human_confirm(state: AgentState) -> AgentState:
     logger.info("\n" + "="*60)
     logger.info("NODE 6: HUMAN CONFIRMATION")
     logger.info("="*60)
@@ -756,15 +1183,14 @@ def node_human_confirm(state: AgentState) -> AgentState:
 
     logger.info(f"Swap: {amount} {asset_in} → {asset_out}")
     logger.info(f"Value: ${state.get('price_usd', 0):.2f}")
-    speak_text(f"Swap: {amount} {asset_in} → {asset_out}")
-    speak_text(f"Value: ${state.get('price_usd', 0):.2f}")
+    speak_text(f"Swap: {amount} {asset_in} → {asset_out}. Value: ${state.get('price_usd', 0):.2f}")
 
-    user_input = input("Approve? (yes/no): ").strip().lower()
+    user_input = (await asyncio.to_thread(input, "Approve? (yes/no): ")).strip().lower()
     speak_text(f"User said {user_input}")
     state["user_approved"] = (user_input == "yes")
     return state
 
-def node_execute_swap(state: AgentState) -> AgentState:
+async def node_execute_swap(state: AgentState) -> AgentState:
     """Execute the swap transaction on Sepolia"""
     logger.info(f"\n{'='*60}")
     logger.info(f"NODE 7: EXECUTE SWAP")
@@ -799,22 +1225,21 @@ def node_execute_swap(state: AgentState) -> AgentState:
         speak_text("Approving tokens")
         
         signed_approval = account.sign_transaction(swap_tx["approval_tx"])
-        approval_hash = w3.eth.send_raw_transaction(signed_approval.raw_transaction)
+        approval_hash = await aw3.eth.send_raw_transaction(signed_approval.raw_transaction)
         logger.info(f"Approval tx sent: {approval_hash.hex()}")
         
-        approval_receipt = w3.eth.wait_for_transaction_receipt(approval_hash, timeout=120)
+        approval_receipt = await await_receipt_ws(approval_hash, timeout=120)
         if approval_receipt["status"] != 1:
             raise Exception("Approval transaction failed")
         
         logger.info(f"✓ Approval confirmed")
-        speak_text("Approval confirmed")
         
         # Step 2: Execute swap
         logger.info("Step 2: Executing swap...")
-        speak_text("Executing swap")
+        speak_text("Approval confirmed. Executing swap")
         
         signed_swap = account.sign_transaction(swap_tx["swap_tx"])
-        swap_hash = w3.eth.send_raw_transaction(signed_swap.raw_transaction)
+        swap_hash = await aw3.eth.send_raw_transaction(signed_swap.raw_transaction)
         logger.info(f"✓ Swap submitted: {swap_hash.hex()}")
         speak_text("Swap submitted")
         
@@ -830,7 +1255,7 @@ def node_execute_swap(state: AgentState) -> AgentState:
         state["error"] = f"Execution failed: {e}"
         return state
 
-def node_monitor_tx(state: AgentState) -> AgentState:
+async def node_monitor_tx(state: AgentState) -> AgentState:
     """Monitor transaction until confirmed"""
     logger.info(f"\n{'='*60}")
     logger.info(f"NODE 8: MONITOR TRANSACTION")
@@ -840,15 +1265,13 @@ def node_monitor_tx(state: AgentState) -> AgentState:
     logger.info(f"Monitoring tx: {tx_hash}")
     
     try:
-        receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
+        receipt = await await_receipt_ws(tx_hash, timeout=120)
         
         if receipt["status"] == 1:
             logger.info(f"✓ Transaction CONFIRMED")
             logger.info(f"  Block: {receipt['blockNumber']}")
             logger.info(f"  Gas used: {receipt['gasUsed']:,}")
-            speak_text("Transaction CONFIRMED")
-            speak_text(f"Block: {receipt['blockNumber']}")
-            speak_text(f"Gas used: {receipt['gasUsed']:,}")
+            speak_text(f"Transaction CONFIRMED. Block: {receipt['blockNumber']}. Gas used: {receipt['gasUsed']:,}")
             
             # Check final balances
             intent = state["intent"]
@@ -856,7 +1279,11 @@ def node_monitor_tx(state: AgentState) -> AgentState:
             to_token = TOKEN_MAP[intent["asset_out"]]
             from_addr = state["user_wallet"]
             
-            final_balance_out = get_token_balance(to_token["address"], from_addr)
+            final_balances = await asyncio.to_thread(
+                get_token_balances, [from_token["address"], to_token["address"]], from_addr
+            )
+            final_balance_out = final_balances[to_token["address"]]
+            logger.info(f"  New {intent['asset_in']} balance: {final_balances[from_token['address']]:.6f}")
             logger.info(f"  New {intent['asset_out']} balance: {final_balance_out:.6f}")
             
             state["status"] = "completed"
@@ -876,8 +1303,7 @@ def node_monitor_tx(state: AgentState) -> AgentState:
 # Cell 17: Build Graph
 graph = StateGraph(AgentState)
 graph.add_node("INTERPRET_INTENT", node_interpret_intent)
-graph.add_node("PRICE_FETCH", node_price_fetch)
-graph.add_node("QUOTE_FETCH", node_quote_fetch)
+graph.add_node("MARKET_FETCH", node_market_fetch)
 graph.add_node("BUILD_SWAP", node_build_swap)
 graph.add_node("DECIDE", node_decide)
 graph.add_node("HUMAN_CONFIRM", node_human_confirm)
@@ -887,9 +1313,8 @@ graph.add_node("MONITOR",node_monitor_tx)
 graph.set_entry_point("INTERPRET_INTENT")
 graph.set_finish_point("MONITOR")
 
-graph.add_edge("INTERPRET_INTENT", "PRICE_FETCH")
-graph.add_edge("PRICE_FETCH", "QUOTE_FETCH")
-graph.add_edge("QUOTE_FETCH", "BUILD_SWAP")
+graph.add_edge("INTERPRET_INTENT", "MARKET_FETCH")
+graph.add_edge("MARKET_FETCH", "BUILD_SWAP")
 graph.add_edge("BUILD_SWAP", "DECIDE")
 graph.add_conditional_edges(
     "DECIDE",
@@ -902,109 +1327,141 @@ graph.add_conditional_edges(
 graph.add_edge("HUMAN_CONFIRM","EXECUTE")
 graph.add_edge("EXECUTE","MONITOR")
 
+# Compiled once at import; every run reuses it through app.ainvoke(state)
 app = graph.compile()
 
 # Cell 18: Visualize Graph
-print(display(Image(app.get_graph().draw_mermaid_png())))
+# draw_mermaid_png calls the remote mermaid.ink renderer, so only do it when asked
+if __name__ == "__main__" and os.getenv("SHOW_GRAPH"):
+    print(display(Image(app.get_graph().draw_mermaid_png())))
+
 # Cell 19: Test Execution
-print("\n" + "="*80)
-print("DEFI-OPS AGENT - SEPOLIA TESTNET")
-print("="*80)
-
-# Use your wallet address (the one with the private key)
-private_key = os.getenv("PRIVATE_KEY")
-if not private_key:
-    raise ValueError("PRIVATE_KEY not found in .env")
-
-account = w3.eth.account.from_key(private_key)
-test_wallet = account.address
-
-logger.info(f"Using wallet: {test_wallet}")
-logger.info(f"Deployer address: {DEPLOYER_ADDRESS}")
-
-# Check if wallet needs funding
-dash_balance = get_token_balance(DASH_TOKEN, test_wallet)
-sms_balance = get_token_balance(SMS_TOKEN, test_wallet)
-eth_balance = w3.eth.get_balance(test_wallet) / 10**18
-
-logger.info(f"\nCurrent Balances:")
-logger.info(f"  ETH: {eth_balance:.4f}")
-logger.info(f"  DASH: {dash_balance:.2f}")
-logger.info(f"  SMS: {sms_balance:.2f}")
-
-# Fund wallet if needed
-if dash_balance < 100 or sms_balance < 100:
-    logger.info(f"\n⚠️  Wallet needs tokens!")
-    logger.info(f"Attempting to transfer from deployer...")
-    
-    if test_wallet.lower() == DEPLOYER_ADDRESS.lower():
-        logger.info("✓ Using deployer address, tokens should already be available")
-    else:
-        # Transfer tokens from deployer to test wallet
-        mint_test_tokens(test_wallet, amount_dash=500, amount_sms=500)
-        
-        # Recheck balances
-        dash_balance = get_token_balance(DASH_TOKEN, test_wallet)
-        sms_balance = get_token_balance(SMS_TOKEN, test_wallet)
-        logger.info(f"\nUpdated Balances:")
-        logger.info(f"  DASH: {dash_balance:.2f}")
-        logger.info(f"  SMS: {sms_balance:.2f}")
-
-if eth_balance < 0.01:
-    logger.warning(f"\n⚠️  Low ETH balance: {eth_balance:.4f} ETH")
-    logger.warning(f"Get Sepolia ETH from: https://sepoliafaucet.com/")
-    logger.warning(f"Or: https://www.alchemy.com/faucets/ethereum-sepolia")
-    input("Press Enter after getting Sepolia ETH...")
-
-# Now run the agent
-user_input = whisper_transcribe(duration=7) 
-
-initial_state: AgentState = {
-    "user_id": "user1",
-    "user_wallet": test_wallet,
-    "user_input": user_input,
-    "intent": None,
-    "price_usd": None,
-    "quote": None,
-    "confirmation_required": False,
-    "user_approved": None,
-    "execution_tx_hash": None,
-    "status": "initialized",
-    "error": None,
-    "memory": {},
-    "llm_log": [],
-    "swap_transaction": None
-}
+async def run_agent(state: AgentState) -> AgentState:
+    global _AIO_SESSION
+    async with aiohttp.ClientSession() as session:
+        _AIO_SESSION = session
+        await aw3.provider.cache_async_session(session)
+        try:
+            return await app.ainvoke(state)
+        finally:
+            _AIO_SESSION = None
+            await close_ws_connection()
 
-logger.info(f"\nStarting agent...")
-logger.info(f"Input: {user_input}")
-speak_text(f"Starting swap agent")
+async def main():
+    print("\n" + "="*80)
+    print("DEFI-OPS AGENT - SEPOLIA TESTNET")
+    print("="*80)
 
-result = app.invoke(initial_state)
+    # Use your wallet address (the one with the private key)
+    private_key = os.getenv("PRIVATE_KEY")
+    if not private_key:
+        raise ValueError("PRIVATE_KEY not found in .env")
 
-print("\n" + "="*80)
-print("FINAL RESULT")
-print("="*80)
-print(f"Status: {result['status']}")
+    account = w3.eth.account.from_key(private_key)
+    test_wallet = account.address
 
-if result.get('error'):
-    print(f"Error: {result['error']}")
-    speak_text(f"Error: {result['error']}")
-else:
-    print(f"✓ Agent completed successfully!")
-    speak_text("Agent completed successfully!")
-    
-    print(f"\nIntent: {result['intent']}")
-    print(f"Price USD: ${result.get('price_usd', 0):,.2f}")
-    
-    if result.get('execution_tx_hash'):
-        print(f"\n✅ Transaction Hash: {result['execution_tx_hash']}")
-        print(f"View on Etherscan: https://sepolia.etherscan.io/tx/{result['execution_tx_hash']}")
-        speak_text("Transaction successful! Check Etherscan")
-        
-        # Show final balances
-        dash_final = get_token_balance(DASH_TOKEN, test_wallet)
-        sms_final = get_token_balance(SMS_TOKEN, test_wallet)
-        print(f"\nFinal Balances:")
-        print(f"  DASH: {dash_final:.2f}")
-        print(f"  SMS: {sms_final:.2f}")
\ No newline at end of file
+    logger.info(f"Using wallet: {test_wallet}")
+    logger.info(f"Deployer address: {DEPLOYER_ADDRESS}")
+
+    # Load Whisper in the background while balances are checked and the wallet is funded
+    whisper_model = asyncio.create_task(asyncio.to_thread(_whisper, "base"))
+
+    # Check if wallet needs funding (one Multicall3 read), warming the pool token cache meanwhile
+    balances, _ = await asyncio.gather(
+        asyncio.to_thread(get_token_balances, [DASH_TOKEN, SMS_TOKEN, NATIVE_ETH], test_wallet),
+        asyncio.to_thread(_pool_tokens),
+    )
+    dash_balance = balances[DASH_TOKEN]
+    sms_balance = balances[SMS_TOKEN]
+    eth_balance = balances[NATIVE_ETH]
+
+    logger.info(f"\nCurrent Balances:")
+    logger.info(f"  ETH: {eth_balance:.4f}")
+    logger.info(f"  DASH: {dash_balance:.2f}")
+    logger.info(f"  SMS: {sms_balance:.2f}")
+
+    # Fund wallet if needed
+    if dash_balance < 100 or sms_balance < 100:
+        logger.info(f"\n⚠️  Wallet needs tokens!")
+        logger.info(f"Attempting to transfer from deployer...")
+        
+        if test_wallet.lower() == DEPLOYER_ADDRESS.lower():
+            logger.info("✓ Using deployer address, tokens should already be available")
+        else:
+            # Transfer tokens from deployer to test wallet
+            await asyncio.to_thread(mint_test_tokens, test_wallet, amount_dash=500, amount_sms=500)
+            
+            # Recheck balances
+            balances = await asyncio.to_thread(get_token_balances, [DASH_TOKEN, SMS_TOKEN], test_wallet)
+            dash_balance = balances[DASH_TOKEN]
+            sms_balance = balances[SMS_TOKEN]
+            logger.info(f"\nUpdated Balances:")
+            logger.info(f"  DASH: {dash_balance:.2f}")
+            logger.info(f"  SMS: {sms_balance:.2f}")
+
+    if eth_balance < 0.01:
+        logger.warning(f"\n⚠️  Low ETH balance: {eth_balance:.4f} ETH")
+        logger.warning(f"Get Sepolia ETH from: https://sepoliafaucet.com/")
+        logger.warning(f"Or: https://www.alchemy.com/faucets/ethereum-sepolia")
+        await asyncio.to_thread(input, "Press Enter after getting Sepolia ETH...")
+
+    # Now run the agent
+    user_input = await asyncio.to_thread(whisper_transcribe, duration=7, model=await whisper_model)
+
+    initial_state: AgentState = {
+        "user_id": "user1",
+        "user_wallet": test_wallet,
+        "user_input": user_input,
+        "intent": None,
+        "price_usd": None,
+        "quote": None,
+        "confirmation_required": False,
+        "user_approved": None,
+        "execution_tx_hash": None,
+        "status": "initialized",
+        "error": None,
+        "memory": {},
+        "llm_log": [],
+        "swap_transaction": None
+    }
+
+    logger.info(f"\nStarting agent...")
+    logger.info(f"Input: {user_input}")
+    speak_text(f"Starting swap agent")
+
+    result = await run_agent(initial_state)
+
+    print("\n" + "="*80)
+    print("FINAL RESULT")
+    print("="*80)
+    print(f"Status: {result['status']}")
+
+    if result.get('error'):
+        print(f"Error: {result['error']}")
+        speak_text(f"Error: {result['error']}")
+    else:
+        print(f"✓ Agent completed successfully!")
+        speak_text("Agent completed successfully!")
+        
+        print(f"\nIntent: {result['intent']}")
+        print(f"Price USD: ${result.get('price_usd', 0):,.2f}")
+        
+        if result.get('execution_tx_hash'):
+            print(f"\n✅ Transaction Hash: {result['execution_tx_hash']}")
+            print(f"View on Etherscan: https://sepolia.etherscan.io/tx/{result['execution_tx_hash']}")
+            speak_text("Transaction successful! Check Etherscan")
+            
+            # Show final balances
+            final_balances = await asyncio.to_thread(get_token_balances, [DASH_TOKEN, SMS_TOKEN], test_wallet)
+            dash_final = final_balances[DASH_TOKEN]
+            sms_final = final_balances[SMS_TOKEN]
+            print(f"\nFinal Balances:")
+            print(f"  DASH: {dash_final:.2f}")
+            print(f"  SMS: {sms_final:.2f}")
+
+    return result
+
+if __name__ == "__main__":
+    asyncio.run(main())
+    # Let queued speech finish before the interpreter exits and kills the TTS thread
+    speak_flush()